@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+
+class MealAggregates:
+    """Per-(date, meal) sums, counts and earliest times from one grouped reduction.
+
+    ``timestamps`` are the naive Paris ``datetime64[ms]`` times of each row,
+    ``meals`` the meal names and ``nutrients`` the rows x nutrients matrix
+    (NaN where a cell was empty). Groups keep the order in which they first
+    appear in the export. Sums are accumulated in row order, so they match
+    adding the entries up one by one.
+    """
+
+    def __init__(self, timestamps, meals, nutrients):
+        days = timestamps.astype('datetime64[D]')
+        codes, uniques = pd.MultiIndex.from_arrays([days, meals]).factorize()
+        group_count = len(uniques)
+
+        self.keys = [(pd.Timestamp(day).date(), meal) for day, meal in uniques]
+        self.codes = codes
+        self.counts = np.bincount(codes, minlength=group_count)
+
+        self.sums = np.zeros((group_count, nutrients.shape[1]))
+        np.add.at(self.sums, codes, np.nan_to_num(nutrients))
+
+        earliest = np.full(group_count, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(earliest, codes, timestamps.astype('datetime64[ms]').view(np.int64))
+        self.earliest = earliest.view('datetime64[ms]')
+
+        self.days = np.array([day for day, _ in uniques], dtype='datetime64[D]')
+
+        # Row indices of each group, in their original order
+        order = np.argsort(codes, kind='stable')
+        self.rows = np.split(order, np.cumsum(self.counts)[:-1])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _rollup(self, periods):
+        """Sum the meal groups again over ``periods`` (one datetime64[D] per group)."""
+        codes, uniques = pd.factorize(periods, sort=True)
+        sums = np.zeros((len(uniques), self.sums.shape[1]))
+        np.add.at(sums, codes, self.sums)
+        counts = np.zeros(len(uniques), dtype=np.int64)
+        np.add.at(counts, codes, self.counts)
+        meals = np.zeros(len(uniques), dtype=np.int64)
+        np.add.at(meals, codes, 1)
+        return [pd.Timestamp(p).date() for p in uniques], sums, counts, meals
+
+    def daily(self):
+        """``(days, sums, food_counts, meal_counts)`` per calendar day."""
+        return self._rollup(self.days)
+
+    def weekly(self):
+        """``(week_starts, sums, food_counts, meal_counts)`` per ISO week (Monday start)."""
+        day_numbers = self.days.view(np.int64)
+        # 1970-01-01 was a Thursday, three days after the Monday that starts its week
+        week_starts = (day_numbers - (day_numbers + 3) % 7).view('datetime64[D]')
+        return self._rollup(week_starts)
@@ -0,0 +1,271 @@
+import os
+import atexit
+import shutil
+from pathlib import Path
+from datetime import datetime
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from waits import wait_for, url_leaves, cookie_present, step_timer, LOGIN_TIMEOUT
+from config import EMAIL, PASSWORD, CHROME_PROFILE_DIR, CHROME_DOWNLOAD_DIR, DEBUG_DIR, USER_AGENT, log
+
+SITE_URL = "https://www.mynetdiary.com/"
+LOGIN_URL = "https://www.mynetdiary.com/logonPage.do"
+# Only signed-in users get this page; everyone else is sent to the sign-in page
+MEMBER_URL = "https://www.mynetdiary.com/reports.do"
+
+
+LOGIN_URL_FRAGMENTS = ("logonPage.do", "signin")
+
+
+def is_login_url(url):
+    """True if the browser was sent back to the MyNetDiary sign-in page."""
+    return any(fragment.lower() in url.lower() for fragment in LOGIN_URL_FRAGMENTS)
+
+
+class BrowserSession:
+    """A long-lived, logged-in headless Chrome that is reused across jobs.
+
+    The Chrome profile (and with it the session cookies) lives in a fixed
+    directory, so even a relaunched browser usually comes back logged in.
+    The browser is only relaunched when it stops responding, and the login
+    form is only submitted when the session has actually expired.
+    """
+
+    def __init__(self, profile_dir=CHROME_PROFILE_DIR, download_dir=CHROME_DOWNLOAD_DIR):
+        self.profile_dir = profile_dir
+        self.download_dir = download_dir
+        self.driver = None
+        self.logged_in = False
+
+    def _build_options(self):
+        chrome_options = Options()
+        # Re-enable headless mode as this is likely running in a container
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-crash-reporter")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--disable-software-rasterizer")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--remote-debugging-port=0")
+        chrome_options.add_argument("--disable-setuid-sandbox")
+        chrome_options.add_argument("--no-zygote")
+        chrome_options.add_argument("--disable-dbus")
+
+        # Persistent user data directory so cookies survive a relaunch
+        chrome_options.add_argument(f"--user-data-dir={self.profile_dir}")
+
+        # Add user agent to appear as a regular browser
+        chrome_options.add_argument(f"--user-agent={USER_AGENT}")
+
+        # Enable cookies for the login process and configure downloads
+        prefs = {
+            # Allow cookies (value 1 allows, 2 blocks)
+            "profile.default_content_setting_values.cookies": 1,
+            "download.default_directory": self.download_dir,
+            "download.prompt_for_download": False,
+            "directory_upgrade": True
+        }
+        chrome_options.add_experimental_option("prefs", prefs)
+
+        # Set window size to ensure mobile elements don't appear
+        chrome_options.add_argument("--window-size=1920,1080")
+        return chrome_options
+
+    def start(self):
+        """Launch Chrome on the persistent profile."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        os.makedirs(self.download_dir, exist_ok=True)
+
+        # A Chrome that crashed or was killed leaves its singleton locks
+        # behind, which would make the next launch refuse the profile
+        for lock_name in ("SingletonLock", "SingletonCookie", "SingletonSocket"):
+            lock_path = Path(self.profile_dir) / lock_name
+            if lock_path.is_symlink() or lock_path.exists():
+                lock_path.unlink()
+
+        log(f"🌐 Initializing Chrome WebDriver (profile: {self.profile_dir})")
+        with step_timer.step("browser start"):
+            self.driver = webdriver.Chrome(options=self._build_options())
+        # A fresh process has not proven its cookies are still valid yet
+        self.logged_in = False
+
+    def quit(self):
+        """Shut Chrome down, keeping the profile on disk for the next launch."""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                log(f"⚠️ Error while quitting Chrome: {e}")
+            self.driver = None
+            self.logged_in = False
+
+    def is_alive(self):
+        """Health check: does the browser still answer WebDriver commands?"""
+        if self.driver is None:
+            return False
+        try:
+            self.driver.execute_script("return document.readyState")
+            return True
+        except Exception as e:
+            log(f"⚠️ Browser health check failed: {e}")
+            return False
+
+    def has_session_cookies(self):
+        """True if the profile holds any MyNetDiary cookies."""
+        try:
+            return any("mynetdiary" in c.get("domain", "") for c in self.driver.get_cookies())
+        except Exception:
+            return False
+
+    def has_valid_session(self):
+        """True if a members-only page loads without bouncing to the sign-in page.
+
+        Cookies alone prove nothing: the site sets some for anonymous
+        visitors too, so an expired profile still has MyNetDiary cookies.
+        """
+        if not self.has_session_cookies():
+            return False
+        try:
+            self.driver.get(MEMBER_URL)
+        except Exception as e:
+            log(f"⚠️ Could not load {MEMBER_URL} to check the session: {e}")
+            return False
+        return not is_login_url(self.driver.current_url)
+
+    def screenshot(self, name):
+        """Save a timestamped debug screenshot and return its path."""
+        path = f"{DEBUG_DIR}/{name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
+        try:
+            self.driver.save_screenshot(path)
+        except Exception as e:
+            log(f"⚠️ Could not save screenshot {path}: {e}")
+        return path
+
+    def ensure_ready(self):
+        """Make sure there is a live, logged-in browser, doing as little as possible."""
+        if not self.is_alive():
+            if self.driver is not None:
+                log("♻️ Browser is unresponsive, relaunching")
+                self.quit()
+            self.start()
+            # Land on the site so the persisted cookies get picked up
+            self.driver.get(SITE_URL)
+
+        if self.logged_in:
+            log("♻️ Reusing warm browser session")
+            return
+
+        if self.has_valid_session():
+            log("🍪 Restored session from persisted profile")
+            self.logged_in = True
+            return
+
+        self.login()
+
+    def mark_logged_out(self):
+        """Called when the site bounced us to the sign-in page."""
+        self.logged_in = False
+
+    def login(self):
+        """Fill in and submit the MyNetDiary sign-in form."""
+        with step_timer.step("login"):
+            self._login()
+
+    def _login(self):
+        driver = self.driver
+
+        # --- LOGIN ---
+        if not is_login_url(driver.current_url):
+            log("🌐 Navigating to login page")
+            driver.get(LOGIN_URL)
+
+        # Add a screenshot of the login page for debugging
+        login_screenshot = self.screenshot("login_page")
+        log(f"🖼 Login page screenshot: {login_screenshot}")
+
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "username-or-email")))
+
+        # Fill in the form fields
+        username_field = driver.find_element(By.ID, "username-or-email")
+        password_field = driver.find_element(By.ID, "password")
+
+        # Clear fields first to ensure clean input
+        username_field.clear()
+        password_field.clear()
+
+        # Type the credentials
+        username_field.send_keys(EMAIL)
+        log(f"✓ Entered email: {EMAIL[:3]}...{EMAIL[-3:]}")
+        password_field.send_keys(PASSWORD)
+        log("✓ Entered password")
+
+        # Check the "Remember me" checkbox so the persisted profile stays signed in
+        try:
+            remember_me = driver.find_element(By.XPATH, "//input[@type='checkbox' and contains(@class, 'jss107')]")
+            if not remember_me.is_selected():
+                # Click the parent span since the checkbox might be hidden
+                remember_me_label = driver.find_element(By.XPATH, "//span[contains(@class, 'MuiTypography-body1') and text()='Remember me on this computer']")
+                remember_me_label.click()
+                log("✓ Selected 'Remember me' checkbox")
+        except Exception as e:
+            log(f"ℹ️ Could not select 'Remember me' checkbox: {str(e)}")
+
+        # Take screenshot before submitting
+        pre_submit_screenshot = self.screenshot("pre_submit")
+        log(f"🖼 Pre-submit screenshot: {pre_submit_screenshot}")
+
+        # Click the sign-in button using JavaScript for more reliability
+        try:
+            log("🔐 Submitting form with JavaScript")
+            clicked = driver.execute_script("""
+                var buttons = document.querySelectorAll('button');
+                for(var i=0; i<buttons.length; i++) {
+                    if(buttons[i].innerText.includes('SIGN IN')) {
+                        buttons[i].click();
+                        return true;
+                    }
+                }
+                return false;
+            """)
+            if not clicked:
+                # Fall back to the explicit button lookup
+                signin_button = driver.find_element(By.XPATH, "//button[.//span[text()='SIGN IN']]")
+                driver.execute_script("arguments[0].click();", signin_button)
+        except Exception as e:
+            log(f"⚠️ JavaScript form submission failed: {str(e)}")
+
+        # Done as soon as the site moves us off the sign-in page with a session cookie
+        if wait_for(driver, url_leaves(*LOGIN_URL_FRAGMENTS), LOGIN_TIMEOUT, "sign-in redirect"):
+            wait_for(driver, cookie_present("mynetdiary"), LOGIN_TIMEOUT, "session cookie")
+
+        log("🔐 Submitted login form")
+
+        # Take screenshot after submit
+        post_submit_screenshot = self.screenshot("post_submit")
+        log(f"🖼 Post-submit screenshot: {post_submit_screenshot}")
+
+        # Print current URL for debugging
+        log(f"🌐 Current URL after login submit: {driver.current_url}")
+        self.logged_in = not is_login_url(driver.current_url)
+
+    def clear_downloads(self):
+        """Empty the download directory so only the next export lands there."""
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+        os.makedirs(self.download_dir, exist_ok=True)
+
+
+_session = None
+
+
+def get_browser_session():
+    """Return the process-wide browser session, creating it on first use."""
+    global _session
+    if _session is None:
+        _session = BrowserSession()
+        atexit.register(_session.quit)
+    return _session
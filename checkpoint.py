@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+from datetime import datetime, date
+
+from config import STATE_DIR, log
+
+CHECKPOINT_FILE = os.getenv("MND_CHECKPOINT_FILE", os.path.join(STATE_DIR, "checkpoint.json"))
+
+
+def group_hash(rows):
+    """Stable content hash of the rows in one (date, meal) group."""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(repr(row).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Persisted high-water mark plus a content hash per (date, meal) group.
+
+    A run only emits groups whose hash differs from what was last written,
+    and the state is only saved after the InfluxDB write succeeded, so a
+    failed run is simply retried in full next time.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.last_ingested = None
+        self.groups = {}
+        self._pending = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("last_ingested"):
+                self.last_ingested = datetime.fromisoformat(state["last_ingested"])
+            self.groups = state.get("groups", {})
+            log(f"📌 Loaded checkpoint: {len(self.groups)} groups, last ingested {self.last_ingested}")
+        except Exception as e:
+            log(f"⚠️ Could not read checkpoint {self.path}, starting fresh: {e}")
+
+    @staticmethod
+    def _key(group_date, meal):
+        return f"{group_date.isoformat()}|{meal}"
+
+    def window_start(self, default_start):
+        """Start of the ingest window, extended back if earlier runs were missed."""
+        if self.last_ingested is not None and self.last_ingested.date() < default_start:
+            return self.last_ingested.date()
+        return default_start
+
+    def is_changed(self, group_date, meal, digest):
+        """True if the group is new or changed; remembers it for ``commit``."""
+        key = self._key(group_date, meal)
+        if self.groups.get(key) == digest:
+            return False
+        self._pending[key] = digest
+        return True
+
+    def commit(self, high_water_mark, prune_before=None):
+        """Persist the pending groups once their points are safely written."""
+        self.groups.update(self._pending)
+        self._pending = {}
+        if high_water_mark is not None and (self.last_ingested is None or high_water_mark > self.last_ingested):
+            self.last_ingested = high_water_mark
+
+        # Groups older than the window will never be compared again
+        if prune_before is not None:
+            cutoff = prune_before.isoformat() if isinstance(prune_before, date) else prune_before
+            self.groups = {k: v for k, v in self.groups.items() if k.split("|", 1)[0] >= cutoff}
+
+        state = {
+            "last_ingested": self.last_ingested.isoformat() if self.last_ingested else None,
+            "groups": self.groups,
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def discard_pending(self):
+        self._pending = {}
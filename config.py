@@ -0,0 +1,30 @@
+import os
+from datetime import datetime
+
+# InfluxDB v2 config (set these as environment variables)
+INFLUX_URL = os.getenv("INFLUX_URL")
+INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
+INFLUX_ORG = os.getenv("INFLUX_ORG")
+INFLUX_BUCKET = os.getenv("INFLUX_BUCKET")
+
+# MyNetDiary credentials (set these as environment variables)
+EMAIL = os.getenv("MND_EMAIL")
+PASSWORD = os.getenv("MND_PASSWORD")
+
+# Long-lived Chrome state, kept across runs so the browser can be reused warm
+CHROME_PROFILE_DIR = os.getenv("MND_CHROME_PROFILE_DIR", "/app/chrome_profile")
+CHROME_DOWNLOAD_DIR = os.getenv("MND_CHROME_DOWNLOAD_DIR", "/app/chrome_downloads")
+
+# Small state files (cookie jar, checkpoints) that must survive restarts
+STATE_DIR = os.getenv("MND_STATE_DIR", "/app/state")
+
+# Browser identity shared by Chrome and the plain HTTP export client
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
+
+# Where debug screenshots and HTML dumps are written
+DEBUG_DIR = os.getenv("MND_DEBUG_DIR", "/app/downloads")
+
+# --- Helper for logging with timestamps ---
+def log(message):
+    """Prints a message with a timestamp."""
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
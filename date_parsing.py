@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import pytz
+
+from config import log
+
+paris_tz = pytz.timezone('Europe/Paris')
+
+# Formats an export may use when it carries dates as text, in order of preference
+DATE_STRING_FORMATS = ('%d/%m/%Y %H:%M', '%d %m %Y %H:%M', '%m/%d/%Y %H:%M', '%d/%m/%Y', '%m/%d/%Y')
+# Same layout with day and month swapped; only data can tell them apart
+_SWAPPED_FORMATS = {'%d/%m/%Y %H:%M': '%m/%d/%Y %H:%M', '%d/%m/%Y': '%m/%d/%Y'}
+
+# How many text dates are looked at to pick the format
+DETECTION_SAMPLE_SIZE = 200
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NS_PER_DAY = 86400 * 1_000_000_000
+
+
+def _parses_all(values, fmt):
+    try:
+        for value in values:
+            datetime.strptime(value, fmt)
+        return True
+    except ValueError:
+        return False
+
+
+def detect_date_format(samples):
+    """Pick the one format that parses every sample, or None.
+
+    When both day-first and month-first layouts fit (no day above 12 in the
+    sample) the choice is genuinely ambiguous; day-first is kept, as the
+    export is French-localized, and a warning says so.
+    """
+    matching = [fmt for fmt in DATE_STRING_FORMATS if _parses_all(samples, fmt)]
+    if not matching:
+        return None
+    chosen = matching[0]
+    swapped = _SWAPPED_FORMATS.get(chosen)
+    if swapped in matching:
+        log(f"⚠️ Date strings are ambiguous between {chosen!r} and {swapped!r}; assuming day first")
+    return chosen
+
+
+def _parse_one(value):
+    for fmt in DATE_STRING_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_date_strings(values):
+    """Parse text dates into ``datetime64[ms]`` (NaT where unparseable).
+
+    The format is detected once from the first values and the whole column
+    is then parsed in one vectorized call. Only values that do not fit the
+    detected format fall back to trying each format in turn.
+    """
+    values = [str(v).strip() for v in values]
+    if not values:
+        return np.array([], dtype='datetime64[ms]')
+
+    fmt = detect_date_format([v for v in values[:DETECTION_SAMPLE_SIZE] if v])
+    if fmt is None:
+        parsed = np.full(len(values), np.datetime64('NaT', 'ms'))
+    else:
+        parsed = pd.to_datetime(pd.Series(values), format=fmt, errors='coerce').to_numpy().astype('datetime64[ms]')
+
+    for idx in np.flatnonzero(np.isnat(parsed)):
+        fallback = _parse_one(values[idx])
+        if fallback is None:
+            log(f"⚠️ Could not parse date string: {values[idx]}")
+        else:
+            parsed[idx] = np.datetime64(fallback, 'ms')
+    return parsed
+
+
+# UTC offset per (timezone, calendar day); None for days with a DST change
+_day_offsets = {}
+
+
+def _day_offset_ns(tz, day):
+    key = (tz.zone, day)
+    if key not in _day_offsets:
+        start = tz.localize(datetime.combine(day, datetime.min.time())).utcoffset()
+        end = tz.localize(datetime.combine(day, datetime.max.time())).utcoffset()
+        _day_offsets[key] = int(start.total_seconds()) * 1_000_000_000 if start == end else None
+    return _day_offsets[key]
+
+
+def wall_times_to_utc_ns(wall_times, tz=paris_tz):
+    """Convert naive local ``datetime64`` wall times to UTC epoch nanoseconds.
+
+    The timezone offset is looked up once per calendar day (and cached across
+    calls) instead of localizing every row. Only rows on a day with a DST
+    transition are localized one by one, with the same rules as ``tz.localize``.
+    """
+    wall_ns = np.asarray(wall_times).astype('datetime64[ns]').view(np.int64)
+    if len(wall_ns) == 0:
+        return wall_ns.copy()
+
+    day_numbers = wall_ns // _NS_PER_DAY
+    unique_days, inverse = np.unique(day_numbers, return_inverse=True)
+
+    offsets = np.empty(len(unique_days), dtype=np.int64)
+    transition_days = []
+    for i, day_number in enumerate(unique_days.tolist()):
+        offset = _day_offset_ns(tz, (_EPOCH + timedelta(days=day_number)).date())
+        if offset is None:
+            transition_days.append(i)
+            offset = 0
+        offsets[i] = offset
+
+    utc_ns = wall_ns - offsets[inverse]
+    for i in transition_days:
+        for idx in np.flatnonzero(inverse == i):
+            naive = datetime(1970, 1, 1) + timedelta(microseconds=int(wall_ns[idx]) // 1000)
+            offset = tz.localize(naive).utcoffset()
+            utc_ns[idx] = wall_ns[idx] - int(offset.total_seconds()) * 1_000_000_000
+    return utc_ns
+
+
+def utc_ns_to_datetime(utc_ns, tz=paris_tz):
+    """Timezone-aware datetime in ``tz`` for a UTC epoch nanosecond value."""
+    return (_EPOCH + timedelta(microseconds=int(utc_ns) // 1000)).astimezone(tz)
@@ -1,17 +1,80 @@
 #!/usr/bin/env python3
 
 import os
-from influxdb_client import InfluxDBClient
+import time
 import sys
 import traceback
 
+from influx_client import get_influx_client
+
 # InfluxDB v2 config (set these as environment variables)
 INFLUX_URL = os.getenv("INFLUX_URL")
 INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
 INFLUX_ORG = os.getenv("INFLUX_ORG")
 INFLUX_BUCKET = os.getenv("INFLUX_BUCKET")
 
-def check_measurements():
+# How far back the post-run check looks (a Flux duration or RFC3339 time)
+CHECK_RANGE = os.getenv("MND_CHECK_RANGE", "-30d")
+# Seconds a check result is reused before InfluxDB is queried again
+CHECK_CACHE_SECONDS = float(os.getenv("MND_CHECK_CACHE_SECONDS", "300"))
+
+# (bucket, range) -> (time fetched, counts)
+_count_cache = {}
+
+
+def _range_start(range_start):
+    """Flux literal for a range start: durations stay bare, timestamps get time()."""
+    if range_start.startswith("-"):
+        return range_start
+    return f'time(v: "{range_start}")'
+
+
+def query_counts(query_api, range_start=CHECK_RANGE):
+    """Value counts per (measurement, meal, field) since ``range_start``, in one query.
+
+    Everything is grouped and counted server-side, so the round-trip
+    returns a few hundred rows whatever the number of measurements.
+    """
+    query = f'''
+    from(bucket: "{INFLUX_BUCKET}")
+        |> range(start: {_range_start(range_start)})
+        |> group(columns: ["_measurement", "meal", "_field"])
+        |> count()
+        |> yield(name: "count")
+    '''
+
+    counts = {}
+    for table in query_api.query(query):
+        for record in table.records:
+            key = (record.get_measurement(), record.values.get("meal"), record.get_field())
+            counts[key] = counts.get(key, 0) + record.get_value()
+    return counts
+
+
+def summarize_counts(counts):
+    """Points per measurement and per meal from the per-field counts.
+
+    Every point carries at least one field, so the busiest field's count
+    is the number of points (exact for meal_summary, whose points all
+    have food_count).
+    """
+    fields = {}
+    for (measurement, meal, field), count in counts.items():
+        per_field = fields.setdefault(measurement, {})
+        per_field[field] = per_field.get(field, 0) + count
+
+    meals = {}
+    for (measurement, meal, field), count in counts.items():
+        if meal is None:
+            continue
+        per_meal = meals.setdefault(measurement, {})
+        per_meal[meal] = max(per_meal.get(meal, 0), count)
+
+    points = {measurement: max(per_field.values()) for measurement, per_field in fields.items()}
+    return points, fields, meals
+
+
+def check_measurements(range_start=CHECK_RANGE, use_cache=True):
     """List all measurements in the bucket and their count"""
     if not all([INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET]):
         print("❌ Error: Environment variables not set properly")
@@ -19,42 +82,22 @@ def check_measurements():
         return False
     
     try:
-        client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-        query_api = client.query_api()
-        
-        # Query to get all measurements
-        query = f'''
-        import "influxdata/influxdb/schema"
-        
-        schema.measurements(bucket: "{INFLUX_BUCKET}")
-        '''
-        
-        result = query_api.query(query)
-        
-        measurements = []
-        for table in result:
-            for record in table.records:
-                measurements.append(record.values["_value"])
-        
-        print(f"📊 Found {len(measurements)} measurements in bucket '{INFLUX_BUCKET}':")
+        cache_key = (INFLUX_BUCKET, range_start)
+        cached = _count_cache.get(cache_key)
+        if use_cache and cached and time.monotonic() - cached[0] < CHECK_CACHE_SECONDS:
+            counts = cached[1]
+            print(f"📊 Using counts cached {time.monotonic() - cached[0]:.0f}s ago")
+        else:
+            counts = query_counts(get_influx_client().query_api(), range_start)
+            _count_cache[cache_key] = (time.monotonic(), counts)
+
+        points, fields, meals = summarize_counts(counts)
+        print(f"📊 Found {len(points)} measurements in bucket '{INFLUX_BUCKET}' since {range_start}:")
         
-        for measurement in measurements:
-            # Count points in each measurement
-            count_query = f'''
-            from(bucket: "{INFLUX_BUCKET}")
-                |> range(start: -30d)
-                |> filter(fn: (r) => r._measurement == "{measurement}")
-                |> count()
-                |> yield(name: "count")
-            '''
-            
-            count_result = query_api.query(count_query)
-            count = 0
-            for table in count_result:
-                for record in table.records:
-                    count = record.get_value()
-            
-            print(f"   - {measurement}: {count} points")
+        for measurement in sorted(points):
+            print(f"   - {measurement}: {points[measurement]} points, {len(fields[measurement])} fields")
+            for meal, count in sorted(meals.get(measurement, {}).items()):
+                print(f"       {meal}: {count} points")
         
         return True
         
@@ -63,21 +106,6 @@ def check_measurements():
         traceback.print_exc()
         return False
 
-def run_debug_script():
-    """Run the debug_influx.py script"""
-    try:
-        import subprocess
-        result = subprocess.run([sys.executable, "debug_influx.py"], capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"❌ Error running debug script: {result.stderr}")
-        else:
-            print("✅ Debug script executed successfully:")
-            print(result.stdout)
-    
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
 if __name__ == "__main__":
-    if check_measurements():
-        run_debug_script()
+    # Optional range start as the first argument, e.g. -7d or 2025-01-01T00:00:00Z
+    sys.exit(0 if check_measurements(sys.argv[1] if len(sys.argv) > 1 else CHECK_RANGE) else 1)
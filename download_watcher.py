@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+
+from config import log
+
+# How often the fallback poller looks at the directory
+POLL_INTERVAL = 0.1
+# A finished file must keep the same size for this long before it is handed over
+STABLE_INTERVAL = 0.1
+
+# Chrome writes into "<name>.crdownload" and renames it once the download is complete
+PARTIAL_SUFFIXES = (".crdownload", ".tmp", ".part")
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _inotify_watch(directory):
+    """Return an inotify fd watching ``directory``, or None where unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class DownloadWatcher:
+    """Signals as soon as a fully written download shows up in a directory.
+
+    Uses inotify on Linux and falls back to fast polling elsewhere. A file
+    only counts once no partial download is left in the directory and its
+    size has stopped changing, so the parser never sees a truncated export.
+    Enter the watcher before starting the download so no event is missed.
+    """
+
+    def __init__(self, directory, pattern="*.xls"):
+        self.directory = directory
+        self.pattern = pattern
+        self._fd = None
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._fd = _inotify_watch(self.directory)
+        if self._fd is None:
+            log("ℹ️ inotify unavailable, polling the download directory")
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _completed_file(self):
+        directory = Path(self.directory)
+        if any(p.name.endswith(PARTIAL_SUFFIXES) for p in directory.iterdir()):
+            return None
+
+        for candidate in sorted(directory.glob(self.pattern)):
+            try:
+                size = candidate.stat().st_size
+                if size == 0:
+                    continue
+                time.sleep(STABLE_INTERVAL)
+                if candidate.stat().st_size == size:
+                    return str(candidate)
+            except FileNotFoundError:
+                # Renamed away between the glob and the stat
+                continue
+        return None
+
+    def _drain_events(self):
+        try:
+            while True:
+                data = os.read(self._fd, 4096)
+                if not data:
+                    return
+                # Events are only wake-ups; the directory is re-checked afterwards
+                offset = 0
+                while offset < len(data):
+                    _, _, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size + name_len
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def wait(self, timeout=30):
+        """Block until a complete download exists; its path, or None on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            path = self._completed_file()
+            if path:
+                return path
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+
+            if self._fd is not None:
+                ready, _, _ = select.select([self._fd], [], [], remaining)
+                if ready:
+                    self._drain_events()
+            else:
+                time.sleep(min(POLL_INTERVAL, remaining))
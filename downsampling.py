@@ -0,0 +1,160 @@
+import os
+from datetime import datetime, timedelta
+from influxdb_client import TaskCreateRequest
+
+from config import INFLUX_ORG, INFLUX_BUCKET, log
+from influx_client import get_influx_client
+from nutrient_schema import load_aliases
+from date_parsing import paris_tz
+
+# Daily and weekly rollups live apart from the raw points, with their own retention
+ROLLUP_BUCKET = os.getenv("MND_ROLLUP_BUCKET", f"{INFLUX_BUCKET}_rollups")
+# How far back each task run recomputes, so late or replaced entries are picked up
+DAILY_LOOKBACK = os.getenv("MND_ROLLUP_DAILY_LOOKBACK", "8d")
+WEEKLY_LOOKBACK = os.getenv("MND_ROLLUP_WEEKLY_LOOKBACK", "5w")
+# Tasks run once a day, a while after the 02:00 scrape
+TASK_EVERY = os.getenv("MND_ROLLUP_TASK_EVERY", "1d")
+TASK_OFFSET = os.getenv("MND_ROLLUP_TASK_OFFSET", "2h")
+
+TASK_PREFIX = "mnd_rollup_"
+
+# Fields summed from meal_summary: every nutrient it can carry (custom aliases
+# included), plus the food count
+SUMMARY_FIELDS = sorted(load_aliases()) + ["food_count"]
+
+# name -> what to aggregate. Weeks start on Monday, like aggregation.weekly().
+ROLLUPS = {
+    'meal_daily': {
+        'source': 'meal_summary', 'fields': SUMMARY_FIELDS, 'group': ['meal'],
+        'window': '1d', 'lookback': DAILY_LOOKBACK, 'measurement': 'meal_totals_1d',
+    },
+    'daily': {
+        'source': 'meal_summary', 'fields': SUMMARY_FIELDS, 'group': [],
+        'window': '1d', 'lookback': DAILY_LOOKBACK, 'measurement': 'nutrition_1d',
+    },
+    'weekly': {
+        'source': 'meal_summary', 'fields': SUMMARY_FIELDS, 'group': [],
+        'window': '1w', 'lookback': WEEKLY_LOOKBACK, 'measurement': 'nutrition_1w',
+    },
+    'foods_weekly': {
+        'source': 'nutrition_data', 'fields': ['Calories'], 'group': ['food_name'],
+        'window': '1w', 'lookback': WEEKLY_LOOKBACK, 'measurement': 'foods_1w',
+        # Entries and calories per food, to rank the top foods of any period
+        'food_stats': True,
+    },
+}
+
+# Flux windows are aligned on the Unix epoch, a Thursday
+_WEEK_OFFSET = "-3d"
+
+
+def _window_options(window):
+    return f'every: {window}, offset: {_WEEK_OFFSET}, ' if window == '1w' else f'every: {window}, '
+
+
+def _aligned_start(window, start_expr):
+    """Flux expression for the start of the window that contains ``start_expr``.
+
+    Starting mid-window would write a partial sum over a complete one.
+    """
+    if window == '1w':
+        # Shift onto the epoch's Thursday grid, truncate, then shift back to Monday
+        return f'date.sub(d: 3d, from: date.truncate(t: date.add(d: 3d, to: {start_expr}), unit: 1w))'
+    return f'date.truncate(t: {start_expr}, unit: {window})'
+
+
+def rollup_script(spec, start_expr, stop_expr, task_option=""):
+    """Flux that aggregates one rollup between two Flux time expressions into ROLLUP_BUCKET."""
+    field_set = ", ".join(f'"{field}"' for field in spec['fields'])
+    group = ", ".join(f'"{column}"' for column in ['_field'] + spec['group'])
+    window = spec['window']
+    aggregate = f'aggregateWindow({_window_options(window)}fn: {{fn}}, createEmpty: false, timeSrc: "_start")'
+    sink = f'to(bucket: "{ROLLUP_BUCKET}", org: "{INFLUX_ORG}")'
+
+    script = f'''import "date"
+import "timezone"
+
+{task_option}option location = timezone.location(name: "{paris_tz.zone}")
+
+data = from(bucket: "{INFLUX_BUCKET}")
+    |> range(start: {_aligned_start(window, start_expr)}, stop: {stop_expr})
+    |> filter(fn: (r) => r._measurement == "{spec['source']}")
+    |> filter(fn: (r) => contains(value: r._field, set: [{field_set}]))
+    |> group(columns: [{group}])
+'''
+    if spec.get('food_stats'):
+        script += f'''
+data
+    |> {aggregate.format(fn='sum')}
+    |> set(key: "_field", value: "calories")
+    |> set(key: "_measurement", value: "{spec['measurement']}")
+    |> {sink}
+
+data
+    |> {aggregate.format(fn='count')}
+    |> set(key: "_field", value: "entries")
+    |> set(key: "_measurement", value: "{spec['measurement']}")
+    |> {sink}
+'''
+    else:
+        script += f'''
+data
+    |> {aggregate.format(fn='sum')}
+    |> set(key: "_measurement", value: "{spec['measurement']}")
+    |> {sink}
+'''
+    return script
+
+
+def task_script(name, spec):
+    """The rollup as a task that recomputes its last ``lookback`` on every run."""
+    # Options go after the imports, which Flux wants first
+    option = f'option task = {{name: "{TASK_PREFIX}{name}", every: {TASK_EVERY}, offset: {TASK_OFFSET}}}\n'
+    return rollup_script(spec, f"date.sub(d: {spec['lookback']}, from: now())", "now()", task_option=option)
+
+
+def ensure_rollup_bucket():
+    buckets_api = get_influx_client().buckets_api()
+    if buckets_api.find_bucket_by_name(ROLLUP_BUCKET) is None:
+        buckets_api.create_bucket(bucket_name=ROLLUP_BUCKET, org=INFLUX_ORG,
+                                  description="Daily and weekly MyNetDiary rollups")
+        log(f"🪣 Created bucket {ROLLUP_BUCKET}")
+
+
+def install_tasks():
+    """Create or update the rollup tasks, so they always match the current schema."""
+    ensure_rollup_bucket()
+    tasks_api = get_influx_client().tasks_api()
+    for name, spec in ROLLUPS.items():
+        task_name = f"{TASK_PREFIX}{name}"
+        flux = task_script(name, spec)
+        existing = tasks_api.find_tasks(name=task_name, org=INFLUX_ORG)
+        if not existing:
+            tasks_api.create_task(task_create_request=TaskCreateRequest(
+                org=INFLUX_ORG, flux=flux, status="active",
+                description=f"{spec['source']} -> {ROLLUP_BUCKET}/{spec['measurement']}",
+            ))
+            log(f"⏱️ Created task {task_name}")
+        elif existing[0].flux != flux:
+            task = existing[0]
+            task.flux = flux
+            tasks_api.update_task(task)
+            log(f"⏱️ Updated task {task_name}")
+        else:
+            log(f"⏱️ Task {task_name} is up to date")
+
+
+def _flux_time(day):
+    """Flux time literal for Paris midnight at the start of ``day``."""
+    moment = paris_tz.localize(datetime.combine(day, datetime.min.time()))
+    return f'time(v: "{moment.isoformat()}")'
+
+
+def backfill_rollups(first_day, last_day=None):
+    """Compute every rollup from ``first_day`` through ``last_day`` (default: now) in one pass each."""
+    ensure_rollup_bucket()
+    query_api = get_influx_client().query_api()
+    stop_expr = _flux_time(last_day + timedelta(days=1)) if last_day else "now()"
+    for spec in ROLLUPS.values():
+        query_api.query(rollup_script(spec, _flux_time(first_day), stop_expr), org=INFLUX_ORG)
+        log(f"✅ Backfilled {spec['measurement']} from {first_day} to {last_day or 'now'}")
@@ -0,0 +1,107 @@
+import os
+import gzip
+import json
+import hashlib
+from datetime import datetime
+
+from config import STATE_DIR, log
+
+# Every distinct export ever downloaded, gzip-compressed and named by its hash
+ARCHIVE_DIR = os.getenv("MND_ARCHIVE_DIR", os.path.join(STATE_DIR, "archive"))
+
+
+def export_hash(xls_bytes):
+    """Content address of an export: SHA-256 of its raw bytes."""
+    return hashlib.sha256(xls_bytes).hexdigest()
+
+
+class ExportArchive:
+    """Content-addressed store of raw exports with an index by year and fetch time.
+
+    Identical downloads are stored once, whatever day they were fetched on.
+    The index also remembers, per year, the hash of the last export that
+    was fully processed, so an unchanged download can skip parsing.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.index_path = os.path.join(directory, "index.json")
+        self.entries = []
+        self.processed = {}
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.entries = index.get("entries", [])
+            self.processed = index.get("processed", {})
+        except Exception as e:
+            log(f"⚠️ Could not read export archive index {self.index_path}: {e}")
+
+    def _save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries, "processed": self.processed}, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, f"{digest}.xls.gz")
+
+    def store(self, xls_bytes, year):
+        """Archive one download of ``year``'s export and return its hash."""
+        digest = export_hash(xls_bytes)
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                f.write(xls_bytes)
+            os.replace(tmp_path, path)
+            log(f"🗄️ Archived export {digest[:12]} ({len(xls_bytes)} → {os.path.getsize(path)} bytes)")
+
+        self.entries.append({
+            "hash": digest,
+            "year": int(year),
+            "fetched_at": datetime.now().isoformat(timespec="seconds"),
+            "size": len(xls_bytes),
+        })
+        self._save()
+        return digest
+
+    def load(self, digest):
+        """Raw bytes of an archived export."""
+        with gzip.open(self._object_path(digest), "rb") as f:
+            return f.read()
+
+    def latest(self, year):
+        """Hash of the most recently fetched export of ``year``, or None."""
+        for entry in reversed(self.entries):
+            if entry["year"] == int(year):
+                return entry["hash"]
+        return None
+
+    def years(self):
+        return sorted({entry["year"] for entry in self.entries})
+
+    def is_processed(self, digest, year):
+        """True if this exact export was the last one of ``year`` fully written."""
+        return self.processed.get(str(year)) == digest
+
+    def mark_processed(self, digest, year):
+        self.processed[str(year)] = digest
+        self._save()
+
+
+_archive = None
+
+
+def get_archive():
+    """The process-wide export archive, created on first use."""
+    global _archive
+    if _archive is None:
+        _archive = ExportArchive()
+    return _archive
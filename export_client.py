@@ -0,0 +1,217 @@
+import os
+import json
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import STATE_DIR, USER_AGENT, log
+from browser_session import get_browser_session, is_login_url, LOGIN_URL_FRAGMENTS
+from download_watcher import DownloadWatcher
+from waits import (
+    wait_for, any_of, download_started, url_contains_any, step_timer,
+    DOWNLOAD_START_TIMEOUT, DOWNLOAD_TIMEOUT,
+)
+
+EXPORT_URL_TEMPLATE = "https://www.mynetdiary.com/exportData.do?year={year}"
+COOKIE_FILE = os.path.join(STATE_DIR, "cookies.json")
+HTTP_TIMEOUT = float(os.getenv("MND_HTTP_TIMEOUT", "30"))
+
+# Every legacy .xls export is an OLE2 compound document
+XLS_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+class ExportClient:
+    """Fetches the MyNetDiary export over plain HTTP with a reused cookie session.
+
+    Cookies are harvested from the Selenium browser once and saved to disk,
+    so most runs never need Chrome at all. ``fetch`` returns ``None`` when
+    the site rejects the cookies, which is the caller's cue to log in with
+    the browser and hand over fresh cookies.
+    """
+
+    def __init__(self, cookie_file=COOKIE_FILE):
+        self.cookie_file = cookie_file
+        self.http = requests.Session()
+        self.http.headers["User-Agent"] = USER_AGENT
+        # One keep-alive connection pool to the export host
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.http.mount("https://", adapter)
+        self._load_cookie_file()
+
+    def _load_cookie_file(self):
+        if not os.path.exists(self.cookie_file):
+            return
+        try:
+            with open(self.cookie_file, "r", encoding="utf-8") as f:
+                self._set_cookies(json.load(f))
+            log(f"🍪 Loaded saved cookies from {self.cookie_file}")
+        except Exception as e:
+            log(f"⚠️ Could not load saved cookies: {e}")
+
+    def _set_cookies(self, cookies):
+        self.http.cookies.clear()
+        for cookie in cookies:
+            self.http.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+            )
+
+    def has_cookies(self):
+        return len(self.http.cookies) > 0
+
+    def load_browser_cookies(self, cookies):
+        """Adopt cookies from ``driver.get_cookies()`` and persist them."""
+        self._set_cookies(cookies)
+        try:
+            os.makedirs(os.path.dirname(self.cookie_file), exist_ok=True)
+            with open(self.cookie_file, "w", encoding="utf-8") as f:
+                json.dump(cookies, f)
+            os.chmod(self.cookie_file, 0o600)
+        except Exception as e:
+            log(f"⚠️ Could not save cookies: {e}")
+        log(f"🍪 Harvested {len(cookies)} cookies from the browser")
+
+    def fetch(self, url):
+        """Download ``url`` into memory; ``None`` if the cookie session was rejected."""
+        if not self.has_cookies():
+            return None
+
+        try:
+            response = self.http.get(url, timeout=HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            log(f"⚠️ HTTP export request failed: {e}")
+            return None
+
+        if response.status_code != 200:
+            log(f"⚠️ HTTP export returned status {response.status_code}")
+            return None
+
+        # An expired session is answered with the sign-in page, not an error
+        if not response.content.startswith(XLS_MAGIC):
+            log(f"⚠️ HTTP export was not an XLS file (ended at {response.url})")
+            return None
+
+        log(f"📥 Downloaded {len(response.content)} bytes over HTTP")
+        return response.content
+
+
+_client = None
+
+
+def get_export_client():
+    """Return the process-wide export client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = ExportClient()
+    return _client
+
+
+def export_url(year=None):
+    """URL of the yearly XLS export (the current year by default)."""
+    return EXPORT_URL_TEMPLATE.format(year=year or datetime.now().year)
+
+
+def wait_for_download_start(driver, download_dir):
+    """Return once Chrome starts the download or the site bounces us to sign-in."""
+    wait_for(
+        driver,
+        any_of(download_started(download_dir), url_contains_any(*LOGIN_URL_FRAGMENTS)),
+        DOWNLOAD_START_TIMEOUT,
+        "download start",
+    )
+
+
+def download_with_browser(session, url):
+    """Download the export at ``url`` through Chrome and return its bytes."""
+    session.ensure_ready()
+    driver = session.driver
+    session.clear_downloads()
+    temp_dir = session.download_dir
+
+    # Watch the directory before navigating so the download event is not missed
+    with DownloadWatcher(temp_dir) as watcher:
+        # Navigate directly to XLS export URL
+        log("🔍 Navigating to XLS download URL")
+        driver.get(url)
+        wait_for_download_start(driver, temp_dir)
+    
+        # Take a screenshot after navigation to download URL
+        direct_nav_screenshot = session.screenshot("direct_nav")
+        log(f"🖼 Screenshot after navigation to download URL: {direct_nav_screenshot}")
+    
+        # Check if we need to login again
+        if is_login_url(driver.current_url):
+            log("⚠️ Redirected to login page, need to log in again")
+            session.mark_logged_out()
+            session.login()
+        
+            retry_screenshot = session.screenshot("retry_login")
+            log(f"🖼 Screenshot after retry: {retry_screenshot}")
+        
+            # Try direct navigation to download URL again
+            driver.get(url)
+            wait_for_download_start(driver, temp_dir)
+        
+            retry_download_screenshot = session.screenshot("retry_download")
+            log(f"🖼 Screenshot after retry to download URL: {retry_download_screenshot}")
+
+        # Wait for the download to complete
+        log("⏳ Waiting for Excel file to download...")
+    
+        # Wait for a complete file to appear in the download directory
+        with step_timer.step("download"):
+            xls_file_path = watcher.wait(timeout=DOWNLOAD_TIMEOUT)
+        if xls_file_path:
+            log(f"📄 Found downloaded file: {xls_file_path}")
+
+    if not xls_file_path:
+        log("⚠️ No Excel file was downloaded. Taking screenshot for debugging.")
+        export_error_screenshot = session.screenshot("export_error")
+        log(f"🖼 Export error screenshot: {export_error_screenshot}")
+        raise Exception("Failed to download Excel file")
+
+    with open(xls_file_path, "rb") as f:
+        xls_bytes = f.read()
+
+    # The download is only needed in memory from here on
+    try:
+        os.remove(xls_file_path)
+        log(f"🗑️ Deleted Excel file: {xls_file_path}")
+    except Exception as del_err:
+        log(f"⚠️ Could not delete Excel file: {del_err}")
+
+    return xls_bytes
+
+
+def fetch_export(year=None):
+    """Return the raw bytes of one year's export, using the cheapest path that still works.
+
+    The saved cookie session is tried first over plain HTTP. Only when it is
+    rejected does the browser log in so fresh cookies can be harvested, and
+    only if HTTP still fails does the download go through Chrome itself.
+    """
+    client = get_export_client()
+    url = export_url(year)
+
+    with step_timer.step("http export"):
+        xls_bytes = client.fetch(url)
+    if xls_bytes:
+        return xls_bytes
+
+    log("🔐 Cookie session missing or rejected, refreshing it with the browser")
+    session = get_browser_session()
+    session.ensure_ready()
+    client.load_browser_cookies(session.driver.get_cookies())
+
+    with step_timer.step("http export"):
+        xls_bytes = client.fetch(url)
+    if xls_bytes:
+        return xls_bytes
+
+    log("⚠️ HTTP export still rejected, falling back to browser download")
+    xls_bytes = download_with_browser(session, url)
+    # The browser may have logged in again along the way
+    client.load_browser_cookies(session.driver.get_cookies())
+    return xls_bytes
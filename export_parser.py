@@ -0,0 +1,391 @@
+import io
+import traceback
+import numpy as np
+import pandas as pd
+import xlrd
+
+from config import log
+from checkpoint import group_hash
+from nutrient_schema import resolve_schema, nutrient_matrix
+from aggregation import MealAggregates
+from line_protocol import FoodRowEncoder, encode_line, encode_tags
+from tag_schema import TagGuard
+from date_parsing import parse_date_strings, wall_times_to_utc_ns, utc_ns_to_datetime
+from export_archive import export_hash
+from parsed_cache import load_table, save_table
+
+DATE_COLUMN = 'Date & Time'
+MEAL_COLUMN = 'Meal'
+
+# Meal totals echoed in the log
+LOGGED_TOTALS = {
+    'calories': "   Total calories: {:.1f}",
+    'total_fat': "   Total fat: {:.1f}g",
+    'total_carbs': "   Total carbs: {:.1f}g",
+    'protein': "   Total protein: {:.1f}g",
+}
+
+# Calories per gram of each macronutrient, for the daily energy split
+MACRO_CALORIES = {
+    'protein': ('protein_pct', 4),
+    'total_carbs': ('carbs_pct', 4),
+    'total_fat': ('fat_pct', 9),
+}
+
+# Cell types that can be stored in a float column (empty/error cells become NaN)
+_NUMERIC_CELL_TYPES = {
+    xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_NUMBER,
+    xlrd.XL_CELL_DATE, xlrd.XL_CELL_BOOLEAN, xlrd.XL_CELL_ERROR,
+}
+_MISSING_CELL_TYPES = {xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR}
+
+
+class ExportTable:
+    """Column-oriented, typed view of the diary entries in an export.
+
+    ``timestamps`` holds naive Paris wall-clock times as ``datetime64[ms]``,
+    ``meals`` the meal names, and ``columns`` maps every header to one NumPy
+    array: float64 (NaN for empty cells) for numeric columns, object
+    (None for empty cells) for anything containing text.
+    """
+
+    def __init__(self, headers, timestamps, meals, columns):
+        self.headers = headers
+        self.timestamps = timestamps
+        self.meals = meals
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def take(self, mask):
+        """A new table with only the rows selected by ``mask``."""
+        return ExportTable(
+            self.headers,
+            self.timestamps[mask],
+            self.meals[mask],
+            {header: values[mask] for header, values in self.columns.items()},
+        )
+
+
+def _xldate_to_datetime64(values, datemode):
+    """Vectorized ``xlrd.xldate_as_datetime``, rounded to the millisecond like xlrd."""
+    values = np.asarray(values, dtype=np.float64)
+    if datemode:
+        epoch = np.full(values.shape, np.datetime64('1904-01-01', 'ms'))
+    else:
+        # Excel's phantom 1900-02-29 shifts everything from serial 60 onwards
+        epoch = np.where(values < 60, np.datetime64('1899-12-31', 'ms'), np.datetime64('1899-12-30', 'ms'))
+    days = np.trunc(values)
+    milliseconds = np.round((values - days) * 86400000.0)
+    return epoch + days.astype('timedelta64[D]') + milliseconds.astype('timedelta64[ms]')
+
+
+def _date_column(values, types, datemode):
+    """Convert the 'Date & Time' column in one pass; unparseable cells become NaT."""
+    types = np.asarray(types)
+    timestamps = np.full(len(values), np.datetime64('NaT', 'ms'))
+
+    numeric = (types == xlrd.XL_CELL_DATE) | (types == xlrd.XL_CELL_NUMBER)
+    if numeric.any():
+        serials = np.array([v for v, is_num in zip(values, numeric) if is_num], dtype=np.float64)
+        timestamps[numeric] = _xldate_to_datetime64(serials, datemode)
+
+    # Text dates: the format is detected once, then the lot is parsed in one go
+    text = types == xlrd.XL_CELL_TEXT
+    if text.any():
+        timestamps[text] = parse_date_strings([v for v, is_text in zip(values, text) if is_text])
+
+    return timestamps
+
+
+def _typed_column(values, types):
+    """One header's cells as a float64 array when possible, else as objects."""
+    if all(t in _NUMERIC_CELL_TYPES for t in types):
+        column = np.array(
+            [np.nan if t in _MISSING_CELL_TYPES else v for v, t in zip(values, types)],
+            dtype=np.float64,
+        )
+        return column
+    return np.array(
+        [None if t in _MISSING_CELL_TYPES or v == '' else v for v, t in zip(values, types)],
+        dtype=object,
+    )
+
+
+def _table_from_xlrd(xls_bytes):
+    workbook = xlrd.open_workbook(file_contents=xls_bytes)
+    sheet = workbook.sheet_by_index(0)
+
+    headers = sheet.row_values(0)
+    log(f"📊 Found {len(headers)} columns")
+
+    stripped = [str(header).strip() for header in headers]
+    if DATE_COLUMN not in stripped:
+        log(f"⚠️ Could not find '{DATE_COLUMN}' column in the Excel file")
+        raise Exception(f"Missing '{DATE_COLUMN}' column")
+    if MEAL_COLUMN not in stripped:
+        log(f"⚠️ Could not find '{MEAL_COLUMN}' column in the Excel file")
+        raise Exception(f"Missing '{MEAL_COLUMN}' column")
+    date_time_idx = stripped.index(DATE_COLUMN)
+    meal_idx = stripped.index(MEAL_COLUMN)
+
+    # Each column is read exactly once, straight from xlrd's column arrays
+    columns = {}
+    for col_idx, header in enumerate(headers):
+        columns[header] = _typed_column(sheet.col_values(col_idx, 1), sheet.col_types(col_idx, 1))
+
+    timestamps = _date_column(
+        sheet.col_values(date_time_idx, 1), sheet.col_types(date_time_idx, 1), workbook.datemode
+    )
+    meals = np.array(sheet.col_values(meal_idx, 1), dtype=object)
+    return ExportTable(headers, timestamps, meals, columns)
+
+
+def _table_from_dataframe(xls_bytes):
+    df = pd.read_excel(io.BytesIO(xls_bytes))
+    if DATE_COLUMN not in df.columns or MEAL_COLUMN not in df.columns:
+        raise Exception(f"Missing '{DATE_COLUMN}' or '{MEAL_COLUMN}' column")
+
+    columns = {}
+    for header in df.columns:
+        series = df[header]
+        if pd.api.types.is_numeric_dtype(series):
+            columns[header] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            columns[header] = series.astype(object).where(series.notna(), None).to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(df[DATE_COLUMN]):
+        timestamps = df[DATE_COLUMN].to_numpy().astype('datetime64[ms]')
+    else:
+        timestamps = parse_date_strings(df[DATE_COLUMN].fillna('').tolist())
+    meals = df[MEAL_COLUMN].to_numpy(dtype=object)
+    return ExportTable(list(df.columns), timestamps, meals, columns)
+
+
+def _parse_workbook(xls_bytes):
+    try:
+        log("🔄 Trying to process with xlrd...")
+        return _table_from_xlrd(xls_bytes)
+    except Exception as xlrd_err:
+        log(f"⚠️ Error using xlrd to process Excel file: {xlrd_err}")
+        log("🔄 Trying pandas for Excel processing...")
+        return _table_from_dataframe(xls_bytes)
+
+
+def read_export(xls_bytes, window_start=None, use_cache=True, window_end=None):
+    """Load an export into an ``ExportTable``, keeping rows in ``[window_start, window_end)``.
+
+    Either bound may be None to leave that side open.
+
+    The full typed table is cached on disk by export hash, so the same
+    export is only decoded from the workbook once.
+    """
+    digest = export_hash(xls_bytes) if use_cache else None
+    table = load_table(digest) if use_cache else None
+    if table is not None:
+        log(f"⚡ Loaded parsed export {digest[:12]} from cache")
+    else:
+        table = _parse_workbook(xls_bytes)
+        if use_cache:
+            save_table(digest, table)
+
+    # NaT never compares true, so rows with unparseable dates drop out here too
+    mask = ~np.isnat(table.timestamps)
+    if window_start is not None:
+        mask &= table.timestamps >= np.datetime64(window_start, 'ms')
+    if window_end is not None:
+        mask &= table.timestamps < np.datetime64(window_end, 'ms')
+    return table.take(mask)
+
+
+def _quiet(message):
+    pass
+
+
+class ParseStats:
+    """Running totals of a parse, filled in as ``stream_points`` yields groups.
+
+    ``read_error`` is set when the export could not be read at all, so a
+    caller can tell that apart from an export with nothing new in it.
+    """
+
+    def __init__(self):
+        self.read_error = None
+        self.newest_entry = None
+        self.skipped_groups = 0
+        self.nutrition_points = 0
+        self.summary_points = 0
+        self.daily_points = 0
+
+    @property
+    def points(self):
+        return self.nutrition_points + self.summary_points + self.daily_points
+
+
+def daily_summary_points(aggregates, schema, days_to_write, tag_guard):
+    """daily_summary lines for ``days_to_write``, rolled up from the meal groups.
+
+    Each day gets its nutrient totals, food and meal counts, and the share
+    of macro calories from protein, carbs and fat, timestamped at Paris
+    midnight.
+    """
+    days, sums, food_counts, meal_counts = aggregates.daily()
+    midnights_ns = wall_times_to_utc_ns(np.array(days, dtype='datetime64[D]')).tolist()
+    tag_guard.observe_series("daily_summary", "")
+
+    lines = []
+    for day_idx, day in enumerate(days):
+        if day not in days_to_write:
+            continue
+        totals = dict(zip(schema, sums[day_idx].tolist()))
+        fields = {
+            "food_count": int(food_counts[day_idx]),
+            "meal_count": int(meal_counts[day_idx]),
+        }
+        fields.update({nutrient_id: total for nutrient_id, total in totals.items() if total > 0})
+
+        macro_calories = {
+            field: totals[nutrient_id] * per_gram
+            for nutrient_id, (field, per_gram) in MACRO_CALORIES.items()
+            if nutrient_id in totals
+        }
+        macro_total = sum(macro_calories.values())
+        if macro_total > 0:
+            for field, calories in macro_calories.items():
+                fields[field] = round(100.0 * calories / macro_total, 2)
+
+        lines.append(encode_line("daily_summary", {}, fields, midnights_ns[day_idx]))
+    return lines
+
+
+def stream_points(xls_bytes, window_start=None, checkpoint=None, verbose=True, stats=None, tag_guard=None,
+                  window_end=None):
+    """Parse a MyNetDiary export, yielding the lines of one (date, meal) group at a time.
+
+    Only entries on or after ``window_start`` are kept (all of them when it
+    is None), and only those before ``window_end`` when it is given. With
+    a ``checkpoint``, groups whose content has not changed since the last
+    run are skipped. ``verbose=False`` silences the per-meal logging,
+    which is what bulk loads want.
+
+    Each yielded chunk holds the group's nutrition_data lines followed by
+    its meal_summary line, so a writer can start sending while the rest of
+    the export is still being encoded. A last chunk holds the
+    daily_summary lines of every day that had a changed group. Counts and
+    the newest entry are recorded on ``stats`` (a ``ParseStats``) as the
+    parse goes.
+
+    ``tag_guard`` (a ``TagGuard``) decides which strings may be tags and
+    counts new series; pass one to save or report on it afterwards.
+    """
+    detail = log if verbose else _quiet
+    if stats is None:
+        stats = ParseStats()
+    if tag_guard is None:
+        tag_guard = TagGuard()
+
+    try:
+        table = read_export(xls_bytes, window_start, window_end=window_end)
+    except Exception as read_err:
+        log(f"❌ Could not read Excel file: {read_err}")
+        traceback.print_exc()
+        stats.read_error = read_err
+        return
+
+    log(f"✅ Found {len(table)} entries since {window_start or 'the start of the export'}")
+    if len(table) == 0:
+        return
+
+    # Plain Python values per column, with empty cells as None
+    column_values = {}
+    for header, values in table.columns.items():
+        if values.dtype == np.float64:
+            column_values[header] = [None if v != v else v for v in values.tolist()]
+        else:
+            column_values[header] = values.tolist()
+
+    # Header names are matched to nutrients once per workbook, not once per row
+    schema = resolve_schema(table.headers)
+    nutrients = nutrient_matrix(table.columns, schema, len(table))
+
+    # Every (date, meal) group is summed in one grouped reduction
+    aggregates = MealAggregates(table.timestamps, table.meals, nutrients)
+
+    # Paris wall-clock times to UTC, with the timezone offset looked up once per day
+    times_ns = wall_times_to_utc_ns(table.timestamps).tolist()
+    stats.newest_entry = utc_ns_to_datetime(max(times_ns))
+    earliest_ns = wall_times_to_utc_ns(aggregates.earliest).tolist()
+
+    # Keys and field order are worked out once for the whole workbook
+    encoder = FoodRowEncoder(table.headers, tag_guard)
+
+    changed_days = set()
+
+    # Create meal summaries and individual data points
+    for group_idx, (meal_date, meal_name) in enumerate(aggregates.keys):
+        rows = aggregates.rows[group_idx].tolist()
+
+        # Skip groups whose content is identical to what was already written
+        digest = group_hash([times_ns[row_idx]] + [values[row_idx] for values in column_values.values()] for row_idx in rows)
+        if checkpoint is not None and not checkpoint.is_changed(meal_date, meal_name, digest):
+            stats.skipped_groups += 1
+            continue
+
+        detail(f"📊 Processing {len(rows)} entries for meal: {meal_name} on {meal_date}")
+        changed_days.add(meal_date)
+
+        group_points = encoder.encode(column_values, rows, meal_name, [times_ns[row_idx] for row_idx in rows])
+        stats.nutrition_points += len(group_points)
+
+        # Create a summary point for the entire meal
+        try:
+            earliest_time = aggregates.earliest[group_idx].item()
+            detail(f"📊 Creating meal summary for {meal_name} on {meal_date} at {earliest_time.strftime('%H:%M')}")
+            
+            # Add nutritional fields - only add non-zero values
+            summary_fields = {"food_count": int(aggregates.counts[group_idx])}
+            for nutrient_id, total in zip(schema, aggregates.sums[group_idx].tolist()):
+                if total > 0:
+                    summary_fields[nutrient_id] = total
+                    if nutrient_id in LOGGED_TOTALS:
+                        detail(LOGGED_TOTALS[nutrient_id].format(total))
+            
+            # Create a separate summary point, timestamped in UTC; the date is a field, not a daily series
+            summary_tags, text_fields = tag_guard.split("meal_summary", {"meal": meal_name, "date": meal_date.isoformat()})
+            summary_fields.update(text_fields)
+            tag_guard.observe_series("meal_summary", encode_tags(summary_tags))
+            group_points.append(encode_line("meal_summary", summary_tags, summary_fields, earliest_ns[group_idx]))
+            stats.summary_points += 1
+            
+            detail(f"✅ Meal summary point created. Total points: {stats.points}")
+        except Exception as summary_err:
+            log(f"❌ Error creating meal summary: {summary_err}")
+            traceback.print_exc()
+
+        yield group_points
+
+    # Day totals come from the same grouped sums; unchanged days need no rewrite
+    if changed_days:
+        try:
+            daily_points = daily_summary_points(aggregates, schema, changed_days, tag_guard)
+            stats.daily_points += len(daily_points)
+            detail(f"📅 Created {len(daily_points)} daily summary points")
+            yield daily_points
+        except Exception as daily_err:
+            log(f"❌ Error creating daily summaries: {daily_err}")
+            traceback.print_exc()
+
+
+def build_points(xls_bytes, window_start=None, checkpoint=None, verbose=True, tag_guard=None, window_end=None):
+    """Parse a whole export into a list of line-protocol strings.
+
+    Same arguments as ``stream_points``, for callers that need every point
+    at once (such as pool workers handing results back). Returns
+    ``(data_points, newest_entry, skipped_groups)``.
+    """
+    stats = ParseStats()
+    data_points = []
+    for group_points in stream_points(xls_bytes, window_start, checkpoint, verbose, stats, tag_guard, window_end):
+        data_points.extend(group_points)
+    return data_points, stats.newest_entry, stats.skipped_groups
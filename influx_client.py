@@ -0,0 +1,51 @@
+import os
+import atexit
+import threading
+from influxdb_client import InfluxDBClient
+
+from config import INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, log
+
+# Keep-alive connections held open to InfluxDB (writer, spool replay and queries share them)
+INFLUX_POOL_SIZE = int(os.getenv("MND_INFLUX_POOL_SIZE", "4"))
+# Per-request timeout (milliseconds)
+INFLUX_TIMEOUT_MS = int(os.getenv("MND_INFLUX_TIMEOUT_MS", "30000"))
+# Compress request bodies; line protocol shrinks roughly tenfold
+INFLUX_GZIP = os.getenv("MND_INFLUX_GZIP", "1").lower() in ("1", "true", "yes")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_influx_client():
+    """The process-wide InfluxDB client, created on first use.
+
+    One client means one urllib3 connection pool, so consecutive jobs,
+    the background writer and the post-run check reuse open keep-alive
+    connections instead of reconnecting (and redoing TLS) every time.
+    The client is thread-safe; callers must not close it.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InfluxDBClient(
+                url=INFLUX_URL,
+                token=INFLUX_TOKEN,
+                org=INFLUX_ORG,
+                timeout=INFLUX_TIMEOUT_MS,
+                enable_gzip=INFLUX_GZIP,
+                connection_pool_maxsize=INFLUX_POOL_SIZE,
+            )
+            atexit.register(close_influx_client)
+        return _client
+
+
+def close_influx_client():
+    """Close the shared client and its connections; the next use opens a new one."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            try:
+                _client.close()
+            except Exception as e:
+                log(f"⚠️ Error closing InfluxDB client: {e}")
+            _client = None
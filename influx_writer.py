@@ -0,0 +1,248 @@
+import os
+import time
+import queue
+import random
+import threading
+from urllib3.exceptions import HTTPError
+from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.rest import ApiException
+
+from config import INFLUX_ORG, INFLUX_BUCKET, log
+from influx_client import get_influx_client
+from spool import get_spool
+
+# A batch is sent as soon as it holds this many lines...
+WRITE_BATCH_SIZE = int(os.getenv("MND_WRITE_BATCH_SIZE", "5000"))
+# ...or once its oldest line has waited this long (seconds)
+WRITE_FLUSH_INTERVAL = float(os.getenv("MND_WRITE_FLUSH_INTERVAL", "1.0"))
+# Chunks the parser may get ahead of the writer before it has to wait
+WRITE_QUEUE_CHUNKS = int(os.getenv("MND_WRITE_QUEUE_CHUNKS", "64"))
+# Retries of a failed batch, waiting retry_interval * 2^attempt (capped) in between
+WRITE_MAX_RETRIES = int(os.getenv("MND_WRITE_MAX_RETRIES", "5"))
+WRITE_RETRY_INTERVAL = float(os.getenv("MND_WRITE_RETRY_INTERVAL", "1.0"))
+WRITE_MAX_RETRY_DELAY = float(os.getenv("MND_WRITE_MAX_RETRY_DELAY", "30.0"))
+
+# Statuses worth retrying: throttling and server-side trouble
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+_CLOSE = object()
+
+
+def _is_retryable(error):
+    """Transient failures are retried; bad data or bad credentials are not."""
+    if isinstance(error, ApiException):
+        return error.status in RETRYABLE_STATUSES
+    # Connection refused, reset, timed out...
+    return isinstance(error, (HTTPError, OSError))
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait (Retry-After), if it said so."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class InfluxWriter:
+    """Background writer that streams line protocol into InfluxDB.
+
+    The parser hands over chunks with ``write`` and carries on while a
+    thread batches them by size and age and sends them synchronously. The
+    hand-over queue is bounded, so a producer that outruns the network
+    waits instead of piling every point up in memory. Batches go through
+    the shared client from ``get_influx_client``.
+
+    A batch that fails with a timeout, a connection error, 429 or 5xx is
+    retried with exponential backoff (and jitter, honouring Retry-After);
+    while that happens the queue fills up and the parser is held back
+    rather than data being dropped. Other errors fail at once.
+
+    With a ``spool``, a batch that still cannot be written is appended to
+    it instead, and so is everything after it in this run, since InfluxDB
+    is evidently down. The points are then safe on disk and the run counts
+    as written; ``replay_spool`` sends them once the database is back.
+
+    ``close`` flushes what is left and re-raises the first write error, so
+    callers can tell whether everything they queued actually landed.
+    """
+
+    def __init__(self, bucket=INFLUX_BUCKET, batch_size=WRITE_BATCH_SIZE,
+                 flush_interval=WRITE_FLUSH_INTERVAL, queue_chunks=WRITE_QUEUE_CHUNKS,
+                 max_retries=WRITE_MAX_RETRIES,
+                 retry_interval=WRITE_RETRY_INTERVAL, max_retry_delay=WRITE_MAX_RETRY_DELAY,
+                 spool=None):
+        self.bucket = bucket
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.max_retry_delay = max_retry_delay
+        self.points_written = 0
+        self.batches_written = 0
+        self.retries = 0
+        self.points_spooled = 0
+        self.error = None
+        self.first_write_at = None
+
+        self._write_api = None
+        self._queue = queue.Queue(maxsize=queue_chunks)
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, lines):
+        """Queue a chunk of line-protocol lines; blocks while the queue is full."""
+        if lines and self.error is None:
+            self._queue.put(lines)
+
+    def close(self):
+        """Flush the remaining lines, stop the thread and raise any write error."""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _backoff(self, attempt, error):
+        delay = min(self.max_retry_delay, self.retry_interval * (2 ** attempt))
+        # Jitter, so several writers do not come back in lockstep
+        delay *= random.uniform(0.5, 1.0)
+        requested = _retry_after(error)
+        if requested is not None:
+            delay = min(self.max_retry_delay, max(delay, requested))
+        return delay
+
+    def _send(self, batch):
+        if self.error is not None:
+            # Once a batch has failed for good the run is retried as a whole; drop the rest
+            return
+        if self.points_spooled:
+            # InfluxDB already failed us this run; don't wait out the retries again
+            self._spool_batch(batch)
+            return
+        attempt = 0
+        while True:
+            try:
+                if self._write_api is None:
+                    self._write_api = get_influx_client().write_api(write_options=SYNCHRONOUS)
+                self._write_api.write(bucket=self.bucket, org=INFLUX_ORG, record=batch)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    log(f"❌ Failed to write {len(batch)} points to InfluxDB: {e}")
+                    if self.spool is not None and _is_retryable(e):
+                        self._spool_batch(batch)
+                    else:
+                        self.error = e
+                    return
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self.retries += 1
+                log(f"⚠️ InfluxDB write failed ({str(e).splitlines()[0]}), "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+        if self.first_write_at is None:
+            self.first_write_at = time.perf_counter()
+            log(f"📤 First batch reached InfluxDB after {self.first_write_at - self._started:.2f}s")
+        self.points_written += len(batch)
+        self.batches_written += 1
+
+    def _spool_batch(self, batch):
+        try:
+            self.spool.append(batch)
+        except Exception as e:
+            log(f"❌ Could not spool {len(batch)} points: {e}")
+            self.error = e
+            return
+        if not self.points_spooled:
+            log(f"💾 InfluxDB unavailable, spooling points to {self.spool.directory}")
+        self.points_spooled += len(batch)
+
+    def _run(self):
+        buffer = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                chunk = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                chunk = None
+
+            if chunk is _CLOSE:
+                if buffer:
+                    self._send(buffer)
+                return
+
+            if chunk:
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval
+                buffer.extend(chunk)
+
+            # Full batches go out straight away
+            while len(buffer) >= self.batch_size:
+                self._send(buffer[:self.batch_size])
+                buffer = buffer[self.batch_size:]
+
+            # Anything left is sent once it has waited long enough
+            if buffer and time.monotonic() >= deadline:
+                self._send(buffer)
+                buffer = []
+            if not buffer:
+                deadline = None
+
+
+_replay_lock = threading.Lock()
+
+
+def replay_spool(spool=None):
+    """Send spooled segments to InfluxDB, oldest first, deleting each once written.
+
+    Stops at the first segment that cannot be written, leaving it and the
+    rest for the next attempt. Returns the number of points replayed.
+    """
+    spool = spool or get_spool()
+    if not _replay_lock.acquire(blocking=False):
+        return 0
+    try:
+        # New failures go to a fresh segment while the existing ones are drained
+        spool.seal()
+        segments = spool.segments()
+        if not segments:
+            return 0
+        log(f"💾 Replaying {len(segments)} spooled segments")
+        replayed = 0
+        for path in segments:
+            lines = spool.read_segment(path)
+            try:
+                # Full-size batches at full speed; the spool itself is the retry
+                with InfluxWriter(flush_interval=0) as writer:
+                    for start in range(0, len(lines), writer.batch_size):
+                        writer.write(lines[start:start + writer.batch_size])
+            except Exception as e:
+                log(f"⚠️ Spool replay stopped, {os.path.basename(path)} kept for later: {e}")
+                break
+            spool.remove(path)
+            replayed += len(lines)
+        log(f"✅ Replayed {replayed} spooled points")
+        return replayed
+    except Exception as e:
+        log(f"❌ Error replaying spool: {e}")
+        return 0
+    finally:
+        _replay_lock.release()
+
+
+def start_spool_replay():
+    """Drain the spool on a background thread, so scraping does not wait for it."""
+    thread = threading.Thread(target=replay_spool, name="spool-replay", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""Loading of MyNetDiary exports into InfluxDB, outside the daily scrape.
+
+    python ingest.py file export.xls --since 2025-07-01
+    python ingest.py file export.xls --dry-run
+    python ingest.py backfill --from-year 2022 --to-year 2025
+    python ingest.py backfill --dir /app/exports
+    python ingest.py backfill --archive
+    python ingest.py replay-spool
+    python ingest.py replace --from 2025-07-01 --to 2025-07-07 export.xls
+    python ingest.py replace --from 2025-07-01 --to 2025-07-07 --archive
+    python ingest.py rollups install
+    python ingest.py rollups backfill --from 2022-01-01
+"""
+
+import os
+import time
+import argparse
+from pathlib import Path
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from config import INFLUX_ORG, INFLUX_BUCKET, log
+from export_parser import ParseStats, build_points, stream_points
+from influx_writer import InfluxWriter, replay_spool
+from spool import get_spool
+from export_archive import get_archive
+from tag_schema import TagGuard
+from influx_client import get_influx_client
+from date_parsing import paris_tz
+
+BACKFILL_WORKERS = int(os.getenv("MND_BACKFILL_WORKERS", str(os.cpu_count() or 2)))
+
+# Measurements the export is the source of truth for, and so may be replaced from it
+REPLACE_MEASUREMENTS = ("nutrition_data", "meal_summary", "daily_summary")
+
+
+def _parse_worker(label, xls_bytes):
+    """Runs in a pool process: parse one export into line protocol.
+
+    The worker's tag guard starts from the saved tag state and is sent
+    back so the parent can merge what it saw.
+    """
+    tag_guard = TagGuard()
+    data_points, _, _ = build_points(xls_bytes, verbose=False, tag_guard=tag_guard)
+    rows = sum(1 for p in data_points if p.startswith('nutrition_data,'))
+    return label, rows, data_points, tag_guard
+
+
+def year_sources(from_year, to_year):
+    """Yield ``(label, bytes)`` for each year's export, downloaded one at a time."""
+    # Imported lazily so file-only loads never touch Selenium
+    from export_client import fetch_export
+    for year in range(from_year, to_year + 1):
+        log(f"📥 Fetching export for {year}")
+        xls_bytes = fetch_export(year)
+        get_archive().store(xls_bytes, year)
+        yield str(year), xls_bytes
+
+
+def archive_sources(years=None):
+    """Yield ``(label, bytes)`` for the latest archived export of each year, no scraping."""
+    archive = get_archive()
+    for year in years or archive.years():
+        digest = archive.latest(year)
+        if digest is None:
+            log(f"⚠️ No archived export for {year}")
+            continue
+        yield f"{year} ({digest[:12]})", archive.load(digest)
+
+
+def directory_sources(directory):
+    """Yield ``(label, bytes)`` for every .xls file in ``directory``."""
+    for path in sorted(Path(directory).glob("*.xls")):
+        yield path.name, path.read_bytes()
+
+
+def ingest_file(path, since=None, dry_run=False):
+    """Parse a downloaded export and write its points, skipping Selenium entirely.
+
+    ``since`` (a date) keeps only entries on or after that day. With
+    ``dry_run`` nothing is written, which makes this a parser benchmark.
+    Returns the number of points built.
+    """
+    xls_bytes = Path(path).read_bytes()
+
+    if dry_run:
+        started = time.perf_counter()
+        data_points, _, _ = build_points(xls_bytes, window_start=since, verbose=False)
+        parse_time = time.perf_counter() - started
+        log(f"📊 Parsed {path} into {len(data_points)} points in {parse_time * 1000:.1f} ms")
+        return len(data_points)
+
+    # Groups stream into the writer while the rest of the file is still being encoded
+    stats = ParseStats()
+    tag_guard = TagGuard()
+    started = time.perf_counter()
+    with InfluxWriter(spool=get_spool()) as writer:
+        for group_points in stream_points(xls_bytes, window_start=since, verbose=False, stats=stats,
+                                          tag_guard=tag_guard):
+            writer.write(group_points)
+    tag_guard.report()
+    tag_guard.save()
+    log(f"✅ Parsed and wrote {stats.points} points from {path} in {time.perf_counter() - started:.2f}s")
+    if writer.points_spooled:
+        log(f"💾 {writer.points_spooled} of them were spooled; run 'ingest.py replay-spool' once InfluxDB is back")
+    return stats.points
+
+
+def backfill(sources, workers=BACKFILL_WORKERS):
+    """Parse exports in a process pool and stream their points into InfluxDB.
+
+    At most ``workers`` exports are in flight at once, and each one is
+    written and dropped as soon as it is parsed, so memory stays bounded
+    by the pool size rather than by the number of years loaded.
+    """
+    writer = InfluxWriter(spool=get_spool())
+    tag_guard = TagGuard()
+
+    started = time.perf_counter()
+    total_rows = 0
+    total_points = 0
+    sources = iter(sources)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                # Keep the pool full without reading every export up front
+                while not exhausted and len(pending) < workers:
+                    try:
+                        label, xls_bytes = next(sources)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(pool.submit(_parse_worker, label, xls_bytes))
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    label, rows, lines, worker_guard = future.result()
+                    tag_guard.merge(worker_guard)
+                    # Queued for the writer thread; the next export is parsed meanwhile
+                    writer.write(lines)
+                    total_rows += rows
+                    total_points += len(lines)
+                    elapsed = time.perf_counter() - started
+                    log(f"✅ {label}: {rows} rows, {len(lines)} points "
+                        f"({total_rows / elapsed:.0f} rows/s overall)")
+    finally:
+        writer.close()
+    tag_guard.report()
+    tag_guard.save()
+
+    elapsed = time.perf_counter() - started
+    log(f"🏁 Backfill done: {total_rows} rows, {total_points} points in {elapsed:.1f}s "
+        f"({total_rows / elapsed if elapsed else 0:.0f} rows/s)")
+    return total_rows
+
+
+def _paris_midnight(day):
+    return paris_tz.localize(datetime.combine(day, datetime.min.time()))
+
+
+def delete_range(first_day, last_day=None, measurements=REPLACE_MEASUREMENTS):
+    """Delete ``measurements`` from ``first_day`` through ``last_day`` (Paris days, inclusive).
+
+    With no ``last_day`` everything from ``first_day`` up to now goes.
+    Returns True if every delete went through.
+    """
+    start = _paris_midnight(first_day)
+    if last_day is None:
+        stop = datetime.now(paris_tz)
+    else:
+        # The delete API's stop is inclusive; stop just short of the next day
+        stop = _paris_midnight(last_day + timedelta(days=1)) - timedelta(microseconds=1)
+    delete_api = get_influx_client().delete_api()
+    deleted_all = True
+    for measurement in measurements:
+        try:
+            delete_api.delete(start, stop, f'_measurement="{measurement}"', bucket=INFLUX_BUCKET, org=INFLUX_ORG)
+            log(f"🗑️ Deleted {measurement} from {start.isoformat()} to {stop.isoformat()}")
+        except Exception as e:
+            log(f"⚠️ Could not delete {measurement} in range, old points may remain: {e}")
+            deleted_all = False
+    return deleted_all
+
+
+def replace_range(sources, first_day, last_day, measurements=REPLACE_MEASUREMENTS):
+    """Replace the points of ``first_day``..``last_day`` (Paris days, inclusive) with an export's.
+
+    The export is parsed before anything is touched, and nothing is
+    deleted if it holds no entries in the range. Only that range of the
+    given measurements is then deleted and the fresh points written. With
+    stable point identities a failed delete leaves stale points at worst,
+    never missing ones, and a failed write lands in the spool.
+    """
+    window_end = last_day + timedelta(days=1)
+    tag_guard = TagGuard()
+    lines = []
+    for label, xls_bytes in sources:
+        data_points, _, _ = build_points(xls_bytes, window_start=first_day, verbose=False,
+                                         tag_guard=tag_guard, window_end=window_end)
+        log(f"📊 {label}: {len(data_points)} points between {first_day} and {last_day}")
+        lines.extend(data_points)
+
+    if not lines:
+        log("⚠️ The export has no entries in that range; nothing deleted")
+        return 0
+
+    delete_range(first_day, last_day, measurements)
+
+    started = time.perf_counter()
+    with InfluxWriter(spool=get_spool()) as writer:
+        for offset in range(0, len(lines), writer.batch_size):
+            writer.write(lines[offset:offset + writer.batch_size])
+    log(f"✅ Replaced {first_day}..{last_day} with {len(lines)} points in {time.perf_counter() - started:.2f}s")
+    tag_guard.report()
+    tag_guard.save()
+    return len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    file_cmd = commands.add_parser("file", help="ingest one downloaded .xls export")
+    file_cmd.add_argument("path")
+    file_cmd.add_argument("--since", type=date.fromisoformat, help="only entries on or after YYYY-MM-DD")
+    file_cmd.add_argument("--dry-run", action="store_true", help="parse only, do not write to InfluxDB")
+
+    backfill_cmd = commands.add_parser("backfill", help="load several years of history")
+    source = backfill_cmd.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-year", type=int, help="first export year to download")
+    source.add_argument("--dir", help="directory of already downloaded .xls exports")
+    source.add_argument("--archive", action="store_true", help="latest archived export of every year")
+    backfill_cmd.add_argument("--to-year", type=int, help="last export year to download (default: --from-year)")
+    backfill_cmd.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="parser processes")
+
+    commands.add_parser("replay-spool", help="send points spooled during an InfluxDB outage")
+
+    replace_cmd = commands.add_parser("replace", help="delete a date range and rewrite it from an export")
+    replace_cmd.add_argument("--from", dest="first_day", type=date.fromisoformat, required=True,
+                             help="first day to replace, YYYY-MM-DD")
+    replace_cmd.add_argument("--to", dest="last_day", type=date.fromisoformat, required=True,
+                             help="last day to replace (inclusive), YYYY-MM-DD")
+    replace_source = replace_cmd.add_mutually_exclusive_group(required=True)
+    replace_source.add_argument("path", nargs="?", help="downloaded .xls export to rewrite from")
+    replace_source.add_argument("--archive", action="store_true", help="latest archived exports of those years")
+    replace_cmd.add_argument("--measurement", action="append", dest="measurements",
+                             help="measurement to replace (repeatable; default: all the export writes)")
+
+    rollups_cmd = commands.add_parser("rollups", help="manage the daily/weekly downsampling tasks")
+    rollup_actions = rollups_cmd.add_subparsers(dest="action", required=True)
+    rollup_actions.add_parser("install", help="create or update the rollup tasks and bucket")
+    rollup_backfill = rollup_actions.add_parser("backfill", help="compute the rollups over past data")
+    rollup_backfill.add_argument("--from", dest="first_day", type=date.fromisoformat, required=True,
+                                 help="first day to roll up, YYYY-MM-DD")
+    rollup_backfill.add_argument("--to", dest="last_day", type=date.fromisoformat,
+                                 help="last day to roll up (default: up to now)")
+
+    args = parser.parse_args()
+
+    if args.command == "file":
+        ingest_file(args.path, since=args.since, dry_run=args.dry_run)
+    elif args.command == "backfill":
+        if args.dir:
+            sources = directory_sources(args.dir)
+        elif args.archive:
+            sources = archive_sources()
+        else:
+            sources = year_sources(args.from_year, args.to_year or args.from_year)
+        backfill(sources, workers=args.workers)
+    elif args.command == "replay-spool":
+        replay_spool()
+    elif args.command == "replace":
+        if args.last_day < args.first_day:
+            parser.error("--to must not be before --from")
+        if args.path:
+            sources = [(args.path, Path(args.path).read_bytes())]
+        else:
+            sources = archive_sources(range(args.first_day.year, args.last_day.year + 1))
+        replace_range(sources, args.first_day, args.last_day, tuple(args.measurements or REPLACE_MEASUREMENTS))
+    elif args.command == "rollups":
+        # Imported here; only this command needs the task definitions
+        import downsampling
+        if args.action == "install":
+            downsampling.install_tasks()
+        else:
+            downsampling.backfill_rollups(args.first_day, args.last_day)
+
+
+if __name__ == "__main__":
+    main()
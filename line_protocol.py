@@ -0,0 +1,195 @@
+import re
+import math
+from functools import lru_cache
+
+from tag_schema import TEXT_FIELD_SUFFIX
+
+# Same escaping rules as influxdb_client's Point
+_ESCAPE_MEASUREMENT = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_ESCAPE_KEY = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_ESCAPE_STRING = str.maketrans({'"': r'\"', '\\': r'\\'})
+
+# Column headers carry their unit after a comma ("Protein, g"); field names drop it
+_UNIT_SUFFIX = re.compile(r',\s*\w+$')
+# Leading number of a text cell such as "60 g" or "1.5 cups"
+_NUMERIC_PREFIX = re.compile(r'^([\d\.]+)')
+
+# Bound on the memoized header/cell normalization caches
+NORMALIZE_CACHE_SIZE = 4096
+
+
+def escape_measurement(name):
+    return str(name).translate(_ESCAPE_MEASUREMENT)
+
+
+def escape_key(key):
+    return str(key).translate(_ESCAPE_KEY)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def escape_tag_value(value):
+    escaped = str(value).translate(_ESCAPE_KEY)
+    # A trailing backslash would escape the separator that follows
+    if escaped.endswith('\\'):
+        escaped += ' '
+    return escaped
+
+
+def format_field_value(value):
+    """Line-protocol text for a field value, or None if it cannot be written."""
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        text = str(value)
+        # Whole numbers are written without the trailing ".0", like the client does
+        return text[:-2] if text.endswith('.0') else text
+    if isinstance(value, str):
+        return f'"{value.translate(_ESCAPE_STRING)}"'
+    raise ValueError(f'Unsupported field value type: {type(value)}')
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def clean_field_name(header):
+    """Strip the unit suffix from a column header."""
+    return _UNIT_SUFFIX.sub('', header).strip()
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def text_cell_field(value):
+    """Field text for a text cell with a leading number ("60 g"), None if it is a tag.
+
+    Exports repeat the same portion strings ("1 cup", "100 g") on thousands of
+    rows, so the regex match and float formatting are done once per string.
+    """
+    numeric_match = _NUMERIC_PREFIX.match(value.strip())
+    if not numeric_match:
+        return None
+    try:
+        return format_field_value(float(numeric_match.group(1)))
+    except ValueError:
+        return None
+
+
+def encode_tags(tags):
+    """The escaped ``,key=value`` tag section of a line, sorted by key; empty tags are left out."""
+    return ''.join(
+        f",{escape_key(k)}={escape_tag_value(v)}"
+        for k, v in sorted(tags.items())
+        if v is not None and str(v) != ''
+    )
+
+
+def encode_line(measurement, tags, fields, time_ns):
+    """One line of line protocol; tags and fields are written sorted by key."""
+    tag_text = encode_tags(tags)
+    field_parts = []
+    for key, value in sorted(fields.items()):
+        if value is None:
+            continue
+        text = format_field_value(value)
+        if text is not None:
+            field_parts.append(f"{escape_key(key)}={text}")
+    if not field_parts:
+        return None
+    return f"{escape_measurement(measurement)}{tag_text} {','.join(field_parts)} {time_ns}"
+
+
+class FoodRowEncoder:
+    """Serializes nutrition_data lines straight from an export's typed columns.
+
+    Everything that depends only on the headers (cleaned names, escaped keys,
+    field order) is computed once per workbook, so encoding a row is a
+    single pass over its cells with no Point objects in between.
+
+    Which strings become tags is up to ``tag_guard`` (a ``TagGuard``);
+    the rest are written as ``<key>_text`` string fields. The food name is
+    written once, as ``food_name``, not again under its own header.
+
+    InfluxDB keeps only the last point written for a given series and
+    time, and foods logged together share the export's minute. Entries of
+    a meal that would land on the same series and time are numbered 0, 1,
+    2... in export order and that many nanoseconds are added to their
+    timestamp. Only true collisions (the same food twice in a meal, or
+    foods whose name went to a text field) are offset, so editing one
+    food never moves the points of the others.
+    """
+
+    MEASUREMENT = "nutrition_data"
+
+    def __init__(self, headers, tag_guard, skip_headers=('Meal', 'Date & Time'), name_header='Name'):
+        self.name_header = name_header
+        self.tag_guard = tag_guard
+        self._prefix = escape_measurement(self.MEASUREMENT)
+
+        # Headers that clean to the same name share one key; the last non-empty cell wins
+        by_key = {}
+        for header in headers:
+            if header in skip_headers or header == name_header:
+                continue
+            by_key.setdefault(clean_field_name(header), []).append(header)
+
+        # (raw key, escaped key, headers newest-first), in the order fields are written
+        self._keys = [
+            (key, escape_key(key), list(reversed(group)))
+            for key, group in sorted(by_key.items())
+        ]
+
+    def encode(self, column_values, rows, meal_name, times_ns):
+        """Line-protocol lines for ``rows`` of one meal.
+
+        ``column_values`` maps each header to its plain Python cell values
+        (None when empty); ``times_ns`` gives each row's timestamp.
+        """
+        guard = self.tag_guard
+        measurement = self.MEASUREMENT
+        # (tag text, time) -> entries already written there in this meal
+        collisions = {}
+        lines = []
+        for row_idx, time_ns in zip(rows, times_ns):
+            tags = {}
+            fields = []
+            for key, escaped_key, headers in self._keys:
+                value = None
+                for header in headers:
+                    value = column_values[header][row_idx]
+                    if value is not None and not (isinstance(value, str) and not value.strip()):
+                        break
+                    value = None
+                if value is None:
+                    continue
+
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    # Direct numeric value
+                    text = format_field_value(float(value))
+                    if text is not None:
+                        fields.append(f"{escaped_key}={text}")
+                else:
+                    # Numeric part of a value with units becomes a field
+                    text = text_cell_field(value) if isinstance(value, str) else None
+                    if text is not None:
+                        fields.append(f"{escaped_key}={text}")
+                    elif guard.is_tag(measurement, key, str(value)):
+                        tags[key] = str(value)
+                    else:
+                        fields.append(f"{escape_key(key + TEXT_FIELD_SUFFIX)}={format_field_value(str(value))}")
+
+            if not fields:
+                continue
+
+            # Meal and food name are tags for easier querying, as long as the schema allows
+            food_name = column_values[self.name_header][row_idx] if self.name_header in column_values else None
+            row_tags, text_fields = guard.split(measurement, {'meal': meal_name, 'food_name': food_name})
+            tags.update(row_tags)
+            for key, value in text_fields.items():
+                fields.append(f"{escape_key(key)}={format_field_value(value)}")
+
+            tag_text = encode_tags(tags)
+            guard.observe_series(measurement, tag_text)
+            offset = collisions.get((tag_text, time_ns), 0)
+            collisions[(tag_text, time_ns)] = offset + 1
+            lines.append(f"{self._prefix}{tag_text} {','.join(fields)} {time_ns + offset}")
+        return lines
@@ -1,793 +1,134 @@
 import os
+import sys
 import time
+import signal
 import schedule
 import traceback
-import re
-import csv
-from pathlib import Path
-from datetime import datetime, date, timedelta, timezone
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait, Select
-from selenium.webdriver.support import expected_conditions as EC
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-import pandas as pd
-import pytz
-
-# InfluxDB v2 config (set these as environment variables)
-INFLUX_URL = os.getenv("INFLUX_URL")
-INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
-INFLUX_ORG = os.getenv("INFLUX_ORG")
-INFLUX_BUCKET = os.getenv("INFLUX_BUCKET")
-
-# MyNetDiary credentials (set these as environment variables)
-EMAIL = os.getenv("MND_EMAIL")
-PASSWORD = os.getenv("MND_PASSWORD")
-
-# --- Helper for logging with timestamps ---
-def log(message):
-    """Prints a message with a timestamp."""
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+from datetime import datetime, timedelta
+
+from config import DEBUG_DIR, log
+from browser_session import get_browser_session
+from export_client import fetch_export
+from checkpoint import Checkpoint
+from export_archive import get_archive
+from export_parser import ParseStats, stream_points
+from tag_schema import TagGuard
+from ingest import REPLACE_MEASUREMENTS, delete_range
+from influx_writer import InfluxWriter, start_spool_replay
+from spool import get_spool
+from waits import step_timer
+
+def migrate_series_layout(checkpoint, window_start):
+    """Clear the ingest window once after the series layout changed.
+
+    Points in the old layout live in other series, so a group rewritten
+    next to them would be counted twice by any query that merges series
+    (the rollups, top foods). The window is deleted before anything is
+    written and its group hashes are forgotten, so this run rewrites every
+    group in it in the new layout. Older points are left as they are;
+    they never overlap the new ones. Raises if the delete fails, so the
+    run is retried rather than writing over the old points.
+    """
+    log(f"🏷️ Series layout changed, clearing {', '.join(REPLACE_MEASUREMENTS)} since {window_start}")
+    if not delete_range(window_start, None, REPLACE_MEASUREMENTS):
+        raise RuntimeError("could not clear the ingest window for the new series layout")
+    checkpoint.groups = {}
 
 def run_job():
     log(f"🚀 Job started")
 
-    # Define the timezone
-    paris_tz = pytz.timezone('Europe/Paris')
+    # The browser is only launched if the HTTP export path needs it
+    session = get_browser_session()
+    step_timer.reset()
+    wrote_points = False
 
-    # Create a unique temporary directory for Chrome user data
-    import tempfile
-    temp_dir = tempfile.mkdtemp(prefix="chrome_user_data_")
-    log(f"📁 Created temporary directory: {temp_dir}")
-    
-    chrome_options = Options()
-    # Re-enable headless mode as this is likely running in a container
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-crash-reporter")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--disable-software-rasterizer")
-    chrome_options.add_argument("--disable-extensions")
-    chrome_options.add_argument("--remote-debugging-port=0")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--disable-setuid-sandbox")
-    chrome_options.add_argument("--no-zygote")
-    chrome_options.add_argument("--disable-dbus")
-    
-    # Specify unique user data directory to avoid conflicts
-    chrome_options.add_argument(f"--user-data-dir={temp_dir}")
-    
-    # Add user agent to appear as a regular browser
-    chrome_options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36")
-    
-    # Enable cookies for the login process and configure downloads
-    prefs = {
-        # Allow cookies (value 1 allows, 2 blocks)
-        "profile.default_content_setting_values.cookies": 1,
-        "download.default_directory": temp_dir,
-        "download.prompt_for_download": False,
-        "directory_upgrade": True
-    }
-    chrome_options.add_experimental_option("prefs", prefs)
-    
-    # Set window size to ensure mobile elements don't appear
-    chrome_options.add_argument("--window-size=1920,1080")
-
-    driver = None
+    # Points left over from an InfluxDB outage go out alongside this run
+    start_spool_replay()
     
     try:
-        log("🌐 Initializing Chrome WebDriver")
-        driver = webdriver.Chrome(options=chrome_options)
-        
-        # --- LOGIN ---
-        log("🌐 Navigating to login page")
-        driver.get("https://www.mynetdiary.com/logonPage.do")
-        
-        # Add a screenshot of the login page for debugging
-        login_screenshot = f"/app/downloads/login_page_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-        driver.save_screenshot(login_screenshot)
-        log(f"🖼 Login page screenshot: {login_screenshot}")
+        xls_bytes = fetch_export()
 
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "username-or-email")))
-        
-        # Fill in the form fields
-        username_field = driver.find_element(By.ID, "username-or-email")
-        password_field = driver.find_element(By.ID, "password")
-        
-        # Clear fields first to ensure clean input
-        username_field.clear()
-        password_field.clear()
-        
-        # Type the credentials
-        username_field.send_keys(EMAIL)
-        log(f"✓ Entered email: {EMAIL[:3]}...{EMAIL[-3:]}")
-        password_field.send_keys(PASSWORD)
-        log("✓ Entered password")
-        
-        # Optional: Check the "Remember me" checkbox
+        # Keep the raw export, and don't parse it again if nothing changed since the last good run
+        export_year = datetime.now().year
+        export_digest = None
         try:
-            remember_me = driver.find_element(By.XPATH, "//input[@type='checkbox' and contains(@class, 'jss107')]")
-            if not remember_me.is_selected():
-                # Click the parent span since the checkbox might be hidden
-                remember_me_label = driver.find_element(By.XPATH, "//span[contains(@class, 'MuiTypography-body1') and text()='Remember me on this computer']")
-                remember_me_label.click()
-                log("✓ Selected 'Remember me' checkbox")
-        except Exception as e:
-            log(f"ℹ️ Could not select 'Remember me' checkbox: {str(e)}")
-        
-        # Take screenshot before submitting
-        pre_submit_screenshot = f"/app/downloads/pre_submit_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-        driver.save_screenshot(pre_submit_screenshot)
-        log(f"🖼 Pre-submit screenshot: {pre_submit_screenshot}")
-        
-        # Click the sign-in button using JavaScript for more reliability
-        try:
-            log("🔐 Submitting form with JavaScript")
-            driver.execute_script("""
-                var buttons = document.querySelectorAll('button');
-                for(var i=0; i<buttons.length; i++) {
-                    if(buttons[i].innerText.includes('SIGN IN')) {
-                        buttons[i].click();
-                        return true;
-                    }
-                }
-                return false;
-            """)
-            time.sleep(5)  # Give more time for the form to submit and process
-        except Exception as e:
-            log(f"⚠️ JavaScript form submission failed: {str(e)}")
-            
-        log("🔐 Submitted login form")
-
-        # Take screenshot after submit
-        post_submit_screenshot = f"/app/downloads/post_submit_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-        driver.save_screenshot(post_submit_screenshot)
-        log(f"🖼 Post-submit screenshot: {post_submit_screenshot}")
-
-        # Print current URL for debugging
-        log(f"🌐 Current URL after login submit: {driver.current_url}")
-
-        # Navigate directly to XLS export URL
-        log("🔍 Navigating to XLS download URL")
-        driver.get("https://www.mynetdiary.com/exportData.do?year=2026")
-        time.sleep(5)  # Wait for download to start
-        
-        # Take a screenshot after navigation to download URL
-        direct_nav_screenshot = f"/app/downloads/direct_nav_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-        driver.save_screenshot(direct_nav_screenshot)
-        log(f"🖼 Screenshot after navigation to download URL: {direct_nav_screenshot}")
-        
-        # Check if we need to login again
-        if "logonPage.do" in driver.current_url or "signin" in driver.current_url.lower():
-            log("⚠️ Redirected to login page, need to log in again")
-            
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "username-or-email")))
-            username_field = driver.find_element(By.ID, "username-or-email")
-            password_field = driver.find_element(By.ID, "password")
-            username_field.clear()
-            password_field.clear()
-            username_field.send_keys(EMAIL)
-            password_field.send_keys(PASSWORD)
-            
-            # Use the explicit button click for the retry
-            signin_button = driver.find_element(By.XPATH, "//button[.//span[text()='SIGN IN']]")
-            driver.execute_script("arguments[0].click();", signin_button)
-            log("🔐 Retried login submission")
-            time.sleep(5)
-            
-            retry_screenshot = f"/app/downloads/retry_login_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-            driver.save_screenshot(retry_screenshot)
-            log(f"🖼 Screenshot after retry: {retry_screenshot}")
-            
-            # Try direct navigation to download URL again
-            driver.get("https://www.mynetdiary.com/exportData.do?year=2026")
-            time.sleep(5)  # Wait for download to start
-            
-            retry_download_screenshot = f"/app/downloads/retry_download_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-            driver.save_screenshot(retry_download_screenshot)
-            log(f"🖼 Screenshot after retry to download URL: {retry_download_screenshot}")
-
-        # Wait for the download to complete
-        log("⏳ Waiting for Excel file to download...")
-        
-        # Wait up to 30 seconds for a file to appear in the download directory
-        max_wait = 30
-        wait_time = 0
-        xls_file_path = None
-        
-        while wait_time < max_wait:
-            # Check if any xls files have been downloaded
-            xls_files = list(Path(temp_dir).glob("*.xls"))
-            if xls_files:
-                xls_file_path = str(xls_files[0])
-                log(f"📄 Found downloaded file: {xls_file_path}")
-                break
-            time.sleep(1)
-            wait_time += 1
-        
-        if not xls_file_path:
-            log("⚠️ No Excel file was downloaded. Taking screenshot for debugging.")
-            export_error_screenshot = f"/app/downloads/export_error_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-            driver.save_screenshot(export_error_screenshot)
-            log(f"🖼 Export error screenshot: {export_error_screenshot}")
-            raise Exception("Failed to download Excel file")
+            archive = get_archive()
+            export_digest = archive.store(xls_bytes, export_year)
+            if archive.is_processed(export_digest, export_year):
+                log("⏭️ Export unchanged since the last successful run, skipping parse and write")
+                return
+        except Exception as archive_err:
+            log(f"⚠️ Could not archive export: {archive_err}")
         
         # Process the Excel file and write to InfluxDB
         log("📊 Processing Excel file...")
         
         try:
             # This single try block will now encompass all data processing and writing.
-            one_week_ago = datetime.now().date() - timedelta(days=7)
-            data_points = []
-            
-            # Process the XLS file using xlrd
+            # Only groups that are new or changed since the last successful run are written
+            checkpoint = Checkpoint()
+            window_start = checkpoint.window_start(datetime.now().date() - timedelta(days=7))
+            stats = ParseStats()
+            tag_guard = TagGuard()
+            if tag_guard.layout_changed():
+                migrate_series_layout(checkpoint, window_start)
+
+            # Groups are handed to the background writer as soon as they are encoded,
+            # so parsing and network I/O overlap and no full point list is ever built
+            # If InfluxDB is down they are spooled to disk instead and replayed later
+            writer = InfluxWriter(spool=get_spool())
             try:
-                import xlrd
-                log("🔄 Trying to process with xlrd...")
-                workbook = xlrd.open_workbook(xls_file_path)
-                sheet = workbook.sheet_by_index(0)
-                
-                # Get headers from first row
-                headers = [sheet.cell_value(0, col) for col in range(sheet.ncols)]
-                log(f"📊 Found headers: {headers}")
-                
-                # Find the index of the 'Date & Time' column
-                date_time_idx = -1
-                meal_idx = -1
-                for idx, header in enumerate(headers):
-                    if header.strip() == 'Date & Time':
-                        date_time_idx = idx
-                    elif header.strip() == 'Meal':
-                        meal_idx = idx
-                
-                if date_time_idx == -1:
-                    log("⚠️ Could not find 'Date & Time' column in the Excel file")
-                    raise Exception("Missing 'Date & Time' column")
-                
-                if meal_idx == -1:
-                    log("⚠️ Could not find 'Meal' column in the Excel file")
-                    raise Exception("Missing 'Meal' column")
-                
-                # Group data points by meal type
-                meal_data = {}
-                recent_entries = 0
-                
-                # Process rows
-                for row_idx in range(1, sheet.nrows):
+                with step_timer.step("parse + influx write"):
                     try:
-                        # Get date/time value
-                        date_time_val = sheet.cell_value(row_idx, date_time_idx)
-                        meal_val = sheet.cell_value(row_idx, meal_idx)
-                        
-                        # Parse the date/time
-                        date_time_obj_naive = None
-                        if isinstance(date_time_val, str):
-                            # Try different date formats
-                            for fmt in ('%d/%m/%Y %H:%M', '%d %m %Y %H:%M', '%m/%d/%Y %H:%M', '%d/%m/%Y', '%m/%d/%Y'):
-                                try:
-                                    date_time_obj_naive = datetime.strptime(date_time_val, fmt)
-                                    break
-                                except ValueError:
-                                    continue
-                            if not date_time_obj_naive:
-                                log(f"⚠️ Could not parse date string: {date_time_val}")
-                                continue
-                        elif isinstance(date_time_val, float):
-                            # Use xlrd's built-in function to correctly convert Excel date float to datetime
-                            date_time_obj_naive = xlrd.xldate_as_datetime(date_time_val, workbook.datemode)
-                        else:
-                            log(f"⚠️ Unknown date format: {type(date_time_val)}")
-                            continue
-
-                        # Localize the naive datetime object to Paris timezone
-                        date_time_obj = paris_tz.localize(date_time_obj_naive)
-                        
-                        # Extract just the date part for comparison
-                        entry_date = date_time_obj.date()
-                        
-                        # Check if this entry is from the last week
-                        if entry_date >= one_week_ago:
-                            recent_entries += 1
-                            
-                            # Create a row data dictionary with all fields
-                            row_data = {}
-                            for col_idx in range(sheet.ncols):
-                                if col_idx < len(headers):
-                                    cell_value = sheet.cell_value(row_idx, col_idx)
-                                    header = headers[col_idx]
-                                    row_data[header] = cell_value
-                            
-                            # Add to the appropriate meal group, keyed by (date, meal)
-                            meal_group_key = (entry_date, meal_val)
-                            if meal_group_key not in meal_data:
-                                meal_data[meal_group_key] = []
-                            
-                            # Store the row data and the parsed datetime
-                            meal_data[meal_group_key].append({
-                                'data': row_data,
-                                'datetime': date_time_obj
-                            })
-                    except Exception as row_err:
-                        log(f"⚠️ Error processing row {row_idx}: {row_err}")
-                        continue
-                
-                log(f"✅ Found {recent_entries} entries from the last week")
-                
-                # Create meal summaries and individual data points
-                for (meal_date_obj, meal_name), entries in meal_data.items():
-                    log(f"📊 Processing {len(entries)} entries for meal: {meal_name} on {meal_date_obj}")
-                    
-                    # Variables for meal summary
-                    earliest_time = None
-                    meal_date = meal_date_obj
-                    total_calories = 0
-                    total_fat = 0
-                    total_carbs = 0
-                    total_protein = 0
-                    total_sat_fat = 0
-                    total_trans_fat = 0
-                    total_net_carbs = 0
-                    total_fiber = 0
-                    total_sodium = 0
-                    total_calcium = 0
-                    
-                    # Process individual entries
-                    for entry in entries:
-                        row_data = entry['data']
-                        timestamp = entry['datetime']
-                        
-                        # Track earliest time for this meal
-                        if earliest_time is None or timestamp < earliest_time:
-                            earliest_time = timestamp
-                            meal_date = timestamp.date()
-                        
-                        # Extract nutritional values for summary
-                        try:
-                            # Extract calories - check multiple possible column names
-                            calories = 0
-                            for cal_column in ['Calories, cals', 'Calories']:
-                                if cal_column in row_data and isinstance(row_data[cal_column], (int, float)):
-                                    calories = float(row_data[cal_column])
-                                    break
-                            total_calories += calories
-                            
-                            # Extract total fat - check multiple possible column names
-                            fat = 0
-                            for fat_column in ['Total Fat, g', 'Total Fat']:
-                                if fat_column in row_data and isinstance(row_data[fat_column], (int, float)):
-                                    fat = float(row_data[fat_column])
-                                    break
-                            total_fat += fat
-                            
-                            # Extract carbs - check multiple possible column names
-                            carbs = 0
-                            for carb_column in ['Total Carbs, g', 'Total Carbs', 'Carbs', 'Carbs, g']:
-                                if carb_column in row_data and isinstance(row_data[carb_column], (int, float)):
-                                    carbs = float(row_data[carb_column])
-                                    break
-                            total_carbs += carbs
-                            
-                            # Extract protein - check multiple possible column names
-                            protein = 0
-                            for protein_column in ['Protein, g', 'Protein']:
-                                if protein_column in row_data and isinstance(row_data[protein_column], (int, float)):
-                                    protein = float(row_data[protein_column])
-                                    break
-                            total_protein += protein
-                            
-                            # Extract saturated fat - check multiple possible column names
-                            sat_fat = 0
-                            for sat_fat_column in ['Saturated Fat, g', 'Saturated Fat', 'Sat. Fat, g']:
-                                if sat_fat_column in row_data and isinstance(row_data[sat_fat_column], (int, float)):
-                                    sat_fat = float(row_data[sat_fat_column])
-                                    break
-                            total_sat_fat += sat_fat
-                            
-                            # Extract trans fat - check multiple possible column names
-                            trans_fat = 0
-                            for trans_fat_column in ['Trans Fat, g', 'Trans Fat']:
-                                if trans_fat_column in row_data and isinstance(row_data[trans_fat_column], (int, float)):
-                                    trans_fat = float(row_data[trans_fat_column])
-                                    break
-                            total_trans_fat += trans_fat
-                            
-                            # Extract net carbs - check multiple possible column names
-                            net_carbs = 0
-                            for net_carbs_column in ['Net Carbs, g', 'Net Carbs']:
-                                if net_carbs_column in row_data and isinstance(row_data[net_carbs_column], (int, float)):
-                                    net_carbs = float(row_data[net_carbs_column])
-                                    break
-                            total_net_carbs += net_carbs
-                            
-                            # Extract fiber - check multiple possible column names
-                            fiber = 0
-                            for fiber_column in ['Dietary Fiber, g', 'Fiber', 'Fiber, g']:
-                                if fiber_column in row_data and isinstance(row_data[fiber_column], (int, float)):
-                                    fiber = float(row_data[fiber_column])
-                                    break
-                            total_fiber += fiber
-                            
-                            # Extract sodium - check multiple possible column names
-                            sodium = 0
-                            for sodium_column in ['Sodium, mg', 'Sodium']:
-                                if sodium_column in row_data and isinstance(row_data[sodium_column], (int, float)):
-                                    sodium = float(row_data[sodium_column])
-                                    break
-                            total_sodium += sodium
-                            
-                            # Extract calcium - check multiple possible column names
-                            calcium = 0
-                            for calcium_column in ['Calcium, mg', 'Calcium']:
-                                if calcium_column in row_data and isinstance(row_data[calcium_column], (int, float)):
-                                    calcium = float(row_data[calcium_column])
-                                    break
-                            total_calcium += calcium
-                        
-                        except Exception as sum_err:
-                            log(f"⚠️ Error calculating nutrition summary for item: {sum_err}")
-                            log(f"   Row data: {row_data.keys()}")
-                        
-                        # Create a data point with meal as a tag for individual food item
-                        point = Point("nutrition_data")
-                        point.tag("meal", meal_name)
-                        
-                        # Add all numeric fields from the row
-                        for key, value in row_data.items():
-                            # Skip the meal field since we're using it as a tag
-                            if key == 'Meal':
-                                continue
-                            
-                            # Skip the Date & Time field since we use it for the point's timestamp
-                            if key == 'Date & Time':
-                                continue
-                                
-                            # Skip empty values
-                            if value is None or (isinstance(value, str) and not value.strip()):
-                                continue
-                            
-                            # Clean the field name for InfluxDB (remove commas, units, etc.)
-                            clean_key = re.sub(r',\s*\w+$', '', key).strip()
-                            
-                            if isinstance(value, (int, float)) and not isinstance(value, bool):
-                                # Direct numeric value
-                                point.field(clean_key, float(value))
-                            elif isinstance(value, str):
-                                # Try to extract numeric part if it has units
-                                numeric_match = re.search(r'^([\d\.]+)', value.strip())
-                                if numeric_match:
-                                    try:
-                                        numeric_value = float(numeric_match.group(1))
-                                        point.field(clean_key, numeric_value)
-                                    except (ValueError, TypeError):
-                                        # If conversion fails, add as a tag
-                                        point.tag(clean_key, value)
-                                else:
-                                    # Non-numeric string becomes a tag
-                                    point.tag(clean_key, value)
-                            else:
-                                # Other types become string tags
-                                point.tag(clean_key, str(value))
-                        
-                        # Add food name as a tag for easier querying
-                        if 'Name' in row_data:
-                            point.tag("food_name", str(row_data['Name']))
-                        
-                        # Use the parsed timestamp for the data point, ensuring it's in UTC
-                        utc_timestamp = timestamp.astimezone(pytz.utc)
-                        point.time(utc_timestamp, WritePrecision.NS)
-                        data_points.append(point)
-                
-                    # Create a summary point for the entire meal
-                    try:
-                        if earliest_time and len(entries) > 0:
-                            log(f"📊 Creating meal summary for {meal_name} on {meal_date} at {earliest_time.strftime('%H:%M')}")
-                            
-                            # Create a separate summary point
-                            summary_point = Point("meal_summary")
-                            summary_point.tag("meal", meal_name)
-                            summary_point.tag("date", meal_date.isoformat())
-                            
-                            # Add nutritional fields - only add non-zero values
-                            summary_point.field("food_count", len(entries))
-                            
-                            if total_calories > 0:
-                                summary_point.field("calories", total_calories)
-                                log(f"   Total calories: {total_calories:.1f}")
-                                
-                            if total_fat > 0:
-                                summary_point.field("total_fat", total_fat)
-                                log(f"   Total fat: {total_fat:.1f}g")
-                                
-                            if total_carbs > 0:
-                                summary_point.field("total_carbs", total_carbs)
-                                log(f"   Total carbs: {total_carbs:.1f}g")
-                                
-                            if total_protein > 0:
-                                summary_point.field("protein", total_protein)
-                                log(f"   Total protein: {total_protein:.1f}g")
-                                
-                            if total_sat_fat > 0:
-                                summary_point.field("saturated_fat", total_sat_fat)
-                                
-                            if total_trans_fat > 0:
-                                summary_point.field("trans_fat", total_trans_fat)
-                                
-                            if total_net_carbs > 0:
-                                summary_point.field("net_carbs", total_net_carbs)
-                                
-                            if total_fiber > 0:
-                                summary_point.field("fiber", total_fiber)
-                                
-                            if total_sodium > 0:
-                                summary_point.field("sodium", total_sodium)
-                                
-                            if total_calcium > 0:
-                                summary_point.field("calcium", total_calcium)
-                            
-                            # Convert the timezone-aware datetime to UTC before writing
-                            utc_timestamp = earliest_time.astimezone(pytz.utc)
-                            summary_point.time(utc_timestamp, WritePrecision.NS)
-                            
-                            # Add to the list of points to write
-                            data_points.append(summary_point)
-                            
-                            log(f"✅ Meal summary point created and added to data_points array. Total points: {len(data_points)}")
-                    except Exception as summary_err:
-                        log(f"❌ Error creating meal summary: {summary_err}")
-                        traceback.print_exc()
-            
-            except Exception as xlrd_err:
-                log(f"⚠️ Error using xlrd to process Excel file: {xlrd_err}")
-                
-                # Try pandas as a fallback
-                try:
-                    log("🔄 Trying pandas for Excel processing...")
-                    df = pd.read_excel(xls_file_path)
-                    
-                    # Convert 'Date & Time' column to datetime
-                    if 'Date & Time' in df.columns:
-                        df['Date & Time'] = pd.to_datetime(df['Date & Time'], errors='coerce', dayfirst=True)
-                        
-                        # Localize to Paris timezone
-                        df['Date & Time'] = df['Date & Time'].dt.tz_localize(paris_tz)
-
-                        # Filter to only include entries from the last week
-                        one_week_ago_pd = pd.Timestamp(one_week_ago, tz=paris_tz)
-                        recent_df = df[df['Date & Time'] >= one_week_ago_pd]
-                        
-                        log(f"✅ Found {len(recent_df)} entries from the last week using pandas")
-                        
-                        # Group by meal
-                        if 'Meal' in df.columns:
-                            # Group by both date and meal for daily meal summaries
-                            recent_df['entry_date'] = recent_df['Date & Time'].dt.date
-                            meal_groups = recent_df.groupby(['entry_date', 'Meal'])
-                            
-                            for (entry_date, meal_name), meal_group in meal_groups:
-                                log(f"📊 Processing {len(meal_group)} entries for meal: {meal_name} on {entry_date}")
-                                
-                                # Variables for meal summary
-                                earliest_time = None
-                                meal_date = entry_date
-                                total_calories = 0
-                                total_fat = 0
-                                total_carbs = 0
-                                total_protein = 0
-                                total_sat_fat = 0
-                                total_trans_fat = 0
-                                total_net_carbs = 0
-                                total_fiber = 0
-                                total_sodium = 0
-                                total_calcium = 0
-                                
-                                # Process individual entries
-                                for _, row in meal_group.iterrows():
-                                    # Track earliest time 
-                                    row_time = row['Date & Time']
-                                    if earliest_time is None or row_time < earliest_time:
-                                        earliest_time = row_time
-                                        meal_date = row_time.date()
-                                    
-                                    # Extract nutritional values for summary
-                                    try:
-                                        # Calories
-                                        if 'Calories, cals' in row and not pd.isna(row['Calories, cals']):
-                                            total_calories += float(row['Calories, cals'])
-                                        
-                                        # Total Fat
-                                        if 'Total Fat, g' in row and not pd.isna(row['Total Fat, g']):
-                                            total_fat += float(row['Total Fat, g'])
-                                        
-                                        # Carbs
-                                        if 'Total Carbs, g' in row and not pd.isna(row['Total Carbs, g']):
-                                            total_carbs += float(row['Total Carbs, g'])
-                                        
-                                        # Protein
-                                        if 'Protein, g' in row and not pd.isna(row['Protein, g']):
-                                            total_protein += float(row['Protein, g'])
-                                        
-                                        # Saturated Fat
-                                        if 'Saturated Fat, g' in row and not pd.isna(row['Saturated Fat, g']):
-                                            total_sat_fat += float(row['Saturated Fat, g'])
-                                        
-                                        # Trans Fat
-                                        if 'Trans Fat, g' in row and not pd.isna(row['Trans Fat, g']):
-                                            total_trans_fat += float(row['Trans Fat, g'])
-                                        
-                                        # Net Carbs
-                                        if 'Net Carbs, g' in row and not pd.isna(row['Net Carbs, g']):
-                                            total_net_carbs += float(row['Net Carbs, g'])
-                                        
-                                        # Fiber
-                                        if 'Dietary Fiber, g' in row and not pd.isna(row['Dietary Fiber, g']):
-                                            total_fiber += float(row['Dietary Fiber, g'])
-                                        
-                                        # Sodium
-                                        if 'Sodium, mg' in row and not pd.isna(row['Sodium, mg']):
-                                            total_sodium += float(row['Sodium, mg'])
-                                        
-                                        # Calcium
-                                        if 'Calcium, mg' in row and not pd.isna(row['Calcium, mg']):
-                                            total_calcium += float(row['Calcium, mg'])
-                                    
-                                    except Exception as sum_err:
-                                        log(f"⚠️ Error calculating nutrition summary: {sum_err}")
-                                    
-                                    # Create individual data point
-                                    point = Point("nutrition_data")
-                                    point.tag("meal", meal_name)
-                                    
-                                    # Add fields and tags
-                                    for col in row.index:
-                                        value = row[col]
-                                        
-                                        # Skip null values and meal (already used as tag)
-                                        if pd.isna(value) or col == 'Meal':
-                                            continue
-                                        
-                                        # Skip the Date & Time field since we use it for the point's timestamp
-                                        if col == 'Date & Time':
-                                            continue
-                                        
-                                        # Clean column name
-                                        clean_col = re.sub(r',\s*\w+$', '', col).strip()
-                                        
-                                        # Handle different data types
-                                        if pd.api.types.is_numeric_dtype(type(value)):
-                                            point.field(clean_col, float(value))
-                                        else:
-                                            # Try to extract numeric part from strings
-                                            if isinstance(value, str):
-                                                numeric_match = re.search(r'^([\d\.]+)', value.strip())
-                                                if numeric_match:
-                                                    try:
-                                                        numeric_value = float(numeric_match.group(1))
-                                                        point.field(clean_col, numeric_value)
-                                                    except (ValueError, TypeError):
-                                                        point.tag(clean_col, str(value))
-                                                else:
-                                                    point.tag(clean_col, str(value))
-                                            else:
-                                                point.tag(clean_col, str(value))
-                                    
-                                    # Add food name as a tag
-                                    if 'Name' in row:
-                                        point.tag("food_name", str(row['Name']))
-                                    
-                                    # Set timestamp, ensuring it's in UTC
-                                    timestamp = row['Date & Time']
-                                    utc_timestamp = timestamp.to_pydatetime().astimezone(pytz.utc)
-                                    point.time(utc_timestamp, WritePrecision.NS)
-                                    
-                                    data_points.append(point)
-                            
-                            # Create a summary point for the entire meal
-                            try:
-                                if earliest_time and len(meal_group) > 0:
-                                    log(f"📊 Creating meal summary for {meal_name} on {meal_date} at {earliest_time.strftime('%H:%M')}")
-                                    
-                                    # Create a separate summary point
-                                    summary_point = Point("meal_summary")
-                                    summary_point.tag("meal", meal_name)
-                                    summary_point.tag("date", meal_date.isoformat())
-                                    
-                                    # Add nutritional fields - only add non-zero values
-                                    summary_point.field("food_count", len(meal_group))
-                                    
-                                    if total_calories > 0:
-                                        summary_point.field("calories", total_calories)
-                                        log(f"   Total calories: {total_calories:.1f}")
-                                        
-                                    if total_fat > 0:
-                                        summary_point.field("total_fat", total_fat)
-                                        log(f"   Total fat: {total_fat:.1f}g")
-                                        
-                                    if total_carbs > 0:
-                                        summary_point.field("total_carbs", total_carbs)
-                                        log(f"   Total carbs: {total_carbs:.1f}g")
-                                        
-                                    if total_protein > 0:
-                                        summary_point.field("protein", total_protein)
-                                        log(f"   Total protein: {total_protein:.1f}g")
-                                        
-                                    if total_sat_fat > 0:
-                                        summary_point.field("saturated_fat", total_sat_fat)
-                                        
-                                    if total_trans_fat > 0:
-                                        summary_point.field("trans_fat", total_trans_fat)
-                                        
-                                    if total_net_carbs > 0:
-                                        summary_point.field("net_carbs", total_net_carbs)
-                                        
-                                    if total_fiber > 0:
-                                        summary_point.field("fiber", total_fiber)
-                                        
-                                    if total_sodium > 0:
-                                        summary_point.field("sodium", total_sodium)
-                                        
-                                    if total_calcium > 0:
-                                        summary_point.field("calcium", total_calcium)
-                                    
-                                    # Convert the timezone-aware datetime to UTC before writing
-                                    utc_timestamp = earliest_time.astimezone(pytz.utc)
-                                    summary_point.time(utc_timestamp, WritePrecision.NS)
-                                    
-                                    # Add to the list of points to write
-                                    data_points.append(summary_point)
-                                    
-                                    log(f"✅ Meal summary point created and added to data_points array. Total points: {len(data_points)}")
-                            except Exception as summary_err:
-                                log(f"❌ Error creating meal summary: {summary_err}")
-                                traceback.print_exc()
-                except Exception as pandas_err:
-                    log(f"❌ Error using pandas to process Excel file: {pandas_err}")
-                    traceback.print_exc()
-            
-            # Write the data points to InfluxDB - this must be outside of any incomplete try blocks
-            if data_points:
-                # Count points by type for logging
-                meal_summary_count = sum(1 for p in data_points if p._name == 'meal_summary')
-                nutrition_data_count = sum(1 for p in data_points if p._name == 'nutrition_data')
-
-                log(f"📤 Writing {len(data_points)} data points to InfluxDB")
-                log(f"   - {meal_summary_count} meal summary points")
-                log(f"   - {nutrition_data_count} nutrition data points")
-                
-                client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-                write_api = client.write_api()
-                
-                try:
-                    write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=data_points)
-                    log("✅ Successfully wrote data to InfluxDB")
-                except Exception as e:
-                    log(f"❌ Failed to write to InfluxDB: {e}")
-                finally:
-                    client.close() # Ensure client is closed and data is flushed
+                        for group_points in stream_points(xls_bytes, window_start, checkpoint, stats=stats, tag_guard=tag_guard):
+                            writer.write(group_points)
+                    finally:
+                        # Flushes what is still queued; raises if any batch failed
+                        writer.close()
+            except Exception as e:
+                log(f"❌ Failed to write to InfluxDB: {e}")
+                # Nothing is recorded, so every group is sent again next run
+                checkpoint.discard_pending()
             else:
-                log("No new data to write to InfluxDB.")
+                if stats.read_error is not None:
+                    # The export was never read; leave it unprocessed so the next run retries it
+                    log("❌ Export could not be parsed, nothing recorded")
+                    checkpoint.discard_pending()
+                    return
+
+                if stats.skipped_groups:
+                    log(f"⏭️ Skipped {stats.skipped_groups} unchanged meal groups")
+
+                if stats.points:
+                    wrote_points = True
+                    if writer.points_written:
+                        log(f"✅ Successfully wrote {writer.points_written} data points to InfluxDB "
+                            f"in {writer.batches_written} batches ({writer.retries} retries)")
+                    if writer.points_spooled:
+                        log(f"💾 {writer.points_spooled} points spooled until InfluxDB is reachable again")
+                    log(f"   - {stats.summary_points} meal summary points")
+                    log(f"   - {stats.nutrition_points} nutrition data points")
+                    log(f"   - {stats.daily_points} daily summary points")
+                else:
+                    log("No new data to write to InfluxDB.")
+                # The checkpoint is only advanced once every point is in InfluxDB or on disk
+                checkpoint.commit(stats.newest_entry, prune_before=window_start)
+                tag_guard.report()
+                tag_guard.save()
+                if export_digest:
+                    archive.mark_processed(export_digest, export_year)
 
         except Exception as processing_err:
             log(f"❌ A critical error occurred during file processing or InfluxDB writing: {processing_err}")
             traceback.print_exc()
-            
-        finally:
-            # This 'finally' block ensures the downloaded file is always cleaned up.
-            if xls_file_path and os.path.exists(xls_file_path):
-                try:
-                    os.remove(xls_file_path)
-                    log(f"🗑️ Deleted Excel file: {xls_file_path}")
-                except Exception as del_err:
-                    log(f"⚠️ Could not delete Excel file: {del_err}")
 
     except Exception as e:
         error_time = datetime.now().strftime("%Y%m%d-%H%M%S")
-        screenshot = f"/app/downloads/error_{error_time}.png"
-        html_dump = f"/app/downloads/error_{error_time}.html"
+        screenshot = f"{DEBUG_DIR}/error_{error_time}.png"
+        html_dump = f"{DEBUG_DIR}/error_{error_time}.html"
 
         try:
+            driver = session.driver
             if driver is not None:
                 driver.save_screenshot(screenshot)
                 with open(html_dump, "w", encoding="utf-8") as f:
@@ -800,23 +141,16 @@ def run_job():
         log("❌ ERROR: Exception occurred during job run")
         traceback.print_exc()
 
+        # A failed run may have left the browser wedged; let the next run health-check it
+        session.mark_logged_out()
+
     finally:
-        # Clean up resources
-        if driver is not None:
-            driver.quit()
-        
-        # Try to clean up the temp directory
-        try:
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            log(f"🧹 Cleaned up temporary directory: {temp_dir}")
-        except Exception as cleanup_err:
-            log(f"⚠️ Could not clean up temporary directory: {cleanup_err}")
+        step_timer.report()
 
-        # Run the debug script to check InfluxDB data
-        check_influxdb_data()
+        # Run the debug script to check InfluxDB data; cached counts are fine if nothing changed
+        check_influxdb_data(use_cache=not wrote_points)
 
-def check_influxdb_data():
+def check_influxdb_data(use_cache=True):
     """Run the debug_influx script to check InfluxDB data"""
     log("\n📊 Checking InfluxDB data after job completion...")
     
@@ -824,7 +158,7 @@ def check_influxdb_data():
         # First try to import the module and run the function
         try:
             import debug_influx
-            result = debug_influx.check_measurements()
+            result = debug_influx.check_measurements(use_cache=use_cache)
             if result:
                 log("✅ Successfully checked InfluxDB data")
             else:
@@ -856,18 +190,26 @@ def check_influxdb_data():
         log(f"❌ Error checking InfluxDB data: {e}")
         traceback.print_exc()
 
-# Run immediately on startup for testing
-print("🚀 Starting MyNetDiary data collector", flush=True)
-run_job()
+def handle_shutdown(signum, frame):
+    """Exit normally on SIGTERM so atexit closes the browser and the InfluxDB client."""
+    log(f"🛑 Received signal {signum}, shutting down")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handle_shutdown)
 
+    # Run immediately on startup for testing
+    print("🚀 Starting MyNetDiary data collector", flush=True)
+    # run_job also replays anything spooled before a restart
+    run_job()
 
-# schedule.every().sunday.at("02:00").do(run_job)
-schedule.every().day.at("02:00").do(run_job)
-print("⏰ Scheduled to run daily at 02:00", flush=True)
+    # schedule.every().sunday.at("02:00").do(run_job)
+    schedule.every().day.at("02:00").do(run_job)
+    print("⏰ Scheduled to run daily at 02:00", flush=True)
 
-# Add a short delay before entering the main loop
-time.sleep(5)
+    # Add a short delay before entering the main loop
+    time.sleep(5)
 
-while True:
-    schedule.run_pending()
-    time.sleep(30)
+    while True:
+        schedule.run_pending()
+        time.sleep(30)
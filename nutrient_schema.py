@@ -0,0 +1,77 @@
+import os
+import json
+import numpy as np
+
+from config import log
+
+# Canonical nutrient id -> export headers that may carry it, in priority order.
+# The id is also the field name used on meal_summary points.
+DEFAULT_NUTRIENT_ALIASES = {
+    'calories': ['Calories, cals', 'Calories'],
+    'total_fat': ['Total Fat, g', 'Total Fat'],
+    'total_carbs': ['Total Carbs, g', 'Total Carbs', 'Carbs', 'Carbs, g'],
+    'protein': ['Protein, g', 'Protein'],
+    'saturated_fat': ['Saturated Fat, g', 'Saturated Fat', 'Sat. Fat, g'],
+    'trans_fat': ['Trans Fat, g', 'Trans Fat'],
+    'net_carbs': ['Net Carbs, g', 'Net Carbs'],
+    'fiber': ['Dietary Fiber, g', 'Fiber', 'Fiber, g'],
+    'sodium': ['Sodium, mg', 'Sodium'],
+    'calcium': ['Calcium, mg', 'Calcium'],
+}
+
+# Optional JSON file of the same shape; its entries override or extend the defaults
+NUTRIENT_ALIASES_FILE = os.getenv("MND_NUTRIENT_ALIASES_FILE")
+
+
+def load_aliases(path=NUTRIENT_ALIASES_FILE):
+    """The alias table, with any overrides from ``path`` applied."""
+    aliases = dict(DEFAULT_NUTRIENT_ALIASES)
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                aliases.update(json.load(f))
+        except Exception as e:
+            log(f"⚠️ Could not load nutrient aliases from {path}: {e}")
+    return aliases
+
+
+def resolve_schema(headers, aliases=None):
+    """Map each canonical nutrient to the header that carries it in this workbook.
+
+    Done once per export, so rows are read by column rather than by probing
+    every alias on every row. Nutrients with no matching header are left out.
+    """
+    if aliases is None:
+        aliases = load_aliases()
+    available = set(headers)
+    schema = {}
+    for nutrient_id, candidates in aliases.items():
+        for header in candidates:
+            if header in available:
+                schema[nutrient_id] = header
+                break
+    missing = [n for n in aliases if n not in schema]
+    if missing:
+        log(f"ℹ️ No column found for nutrients: {', '.join(missing)}")
+    return schema
+
+
+def nutrient_matrix(columns, schema, row_count):
+    """Rows x nutrients float64 matrix, in ``schema`` order, NaN where empty.
+
+    With no nutrient columns at all it is ``row_count`` x 0, so the
+    per-group sums still line up with the rows.
+    """
+    matrix = []
+    for header in schema.values():
+        values = columns[header]
+        if values.dtype != np.float64:
+            # Text in a nutrient column never counts towards the totals
+            values = np.array(
+                [v if isinstance(v, (int, float)) else np.nan for v in values],
+                dtype=np.float64,
+            )
+        matrix.append(values)
+    if not matrix:
+        return np.empty((row_count, 0))
+    return np.column_stack(matrix)
@@ -0,0 +1,106 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from config import STATE_DIR, log
+
+# Typed row tables of recently parsed exports, one directory per export hash
+PARSED_CACHE_DIR = os.getenv("MND_PARSED_CACHE_DIR", os.path.join(STATE_DIR, "parsed"))
+# How many parsed exports to keep; the least recently used go first
+PARSED_CACHE_ENTRIES = int(os.getenv("MND_PARSED_CACHE_ENTRIES", "16"))
+
+# Bumped whenever the on-disk layout or the parser's output changes
+CACHE_VERSION = 1
+
+
+def _entry_dir(digest, directory):
+    return os.path.join(directory, digest)
+
+
+def load_table(digest, directory=PARSED_CACHE_DIR):
+    """The cached ``ExportTable`` for an export hash, or None if there is none.
+
+    Timestamps and numeric columns are memory-mapped ``.npy`` files, so
+    nothing is read from disk until a column is actually used. Text
+    columns and meal names are small and come from the JSON metadata.
+    """
+    # Imported here because export_parser itself uses this module
+    from export_parser import ExportTable
+
+    entry = _entry_dir(digest, directory)
+    meta_path = os.path.join(entry, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION:
+            return None
+
+        timestamps = np.load(os.path.join(entry, "timestamps.npy"), mmap_mode="r")
+        numeric = np.load(os.path.join(entry, "numeric.npy"), mmap_mode="r")
+        numeric_index = {header: i for i, header in enumerate(meta["numeric"])}
+
+        columns = {}
+        for header in meta["columns"]:
+            if header in numeric_index:
+                # One contiguous row of the (columns x rows) matrix per header
+                columns[header] = numeric[numeric_index[header]]
+            else:
+                columns[header] = np.array(meta["text"][header], dtype=object)
+        meals = np.array(meta["meals"], dtype=object)
+
+        # Touch the entry so pruning keeps the ones in use
+        os.utime(entry)
+        return ExportTable(meta["headers"], timestamps, meals, columns)
+    except Exception as e:
+        log(f"⚠️ Could not load parsed cache {digest[:12]}: {e}")
+        return None
+
+
+def save_table(digest, table, directory=PARSED_CACHE_DIR):
+    """Persist an ``ExportTable`` under its export hash."""
+    entry = _entry_dir(digest, directory)
+    if os.path.exists(entry):
+        return
+    tmp_entry = f"{entry}.tmp"
+    try:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+
+        numeric_headers = [h for h, values in table.columns.items() if values.dtype == np.float64]
+        if numeric_headers:
+            numeric = np.vstack([table.columns[h] for h in numeric_headers])
+        else:
+            numeric = np.empty((0, len(table)))
+        np.save(os.path.join(tmp_entry, "numeric.npy"), numeric)
+        np.save(os.path.join(tmp_entry, "timestamps.npy"), np.asarray(table.timestamps, dtype="datetime64[ms]"))
+
+        meta = {
+            "version": CACHE_VERSION,
+            "headers": list(table.headers),
+            "columns": list(table.columns),
+            "numeric": numeric_headers,
+            "text": {h: values.tolist() for h, values in table.columns.items() if h not in set(numeric_headers)},
+            "meals": table.meals.tolist(),
+        }
+        with open(os.path.join(tmp_entry, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        os.replace(tmp_entry, entry)
+        prune(directory)
+    except Exception as e:
+        log(f"⚠️ Could not write parsed cache {digest[:12]}: {e}")
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+
+def prune(directory=PARSED_CACHE_DIR, keep=PARSED_CACHE_ENTRIES):
+    """Drop the least recently used entries beyond ``keep``."""
+    entries = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if not name.endswith(".tmp")
+    ]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for stale in entries[keep:]:
+        shutil.rmtree(stale, ignore_errors=True)
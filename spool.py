@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+
+from config import STATE_DIR, log
+
+# Points that could not be written to InfluxDB wait here until it is back
+SPOOL_DIR = os.getenv("MND_SPOOL_DIR", os.path.join(STATE_DIR, "spool"))
+# A new segment is started once the current one reaches this size
+SPOOL_SEGMENT_BYTES = int(os.getenv("MND_SPOOL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+# Upper bound on the whole spool, so a long outage cannot fill the disk
+SPOOL_MAX_BYTES = int(os.getenv("MND_SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+
+SEGMENT_SUFFIX = ".lp"
+
+
+class SpoolFullError(Exception):
+    pass
+
+
+class Spool:
+    """Append-only, fsynced line-protocol segments on local disk.
+
+    Each ``append`` is written and fsynced before it returns, so once it
+    succeeds the points survive a crash or restart. Segments are plain
+    line protocol, one point per line, named so that sorting them gives
+    the order they were written in. ``seal`` closes the segment being
+    appended to, making every existing segment safe to replay and delete
+    while new points go to a fresh one.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._active = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def size(self):
+        """Total bytes currently spooled."""
+        return sum(os.path.getsize(path) for path in self.segments(include_active=True))
+
+    def append(self, lines):
+        """Durably append ``lines``; raises ``SpoolFullError`` past ``max_bytes``."""
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with self._lock:
+            if self.size() + len(data) > self.max_bytes:
+                raise SpoolFullError(f"spool {self.directory} would exceed {self.max_bytes} bytes")
+
+            created = self._active is None
+            if created:
+                self._active = os.path.join(self.directory, f"{time.time_ns():020d}{SEGMENT_SUFFIX}")
+
+            with open(self._active, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if created:
+                # Make the new file's directory entry durable as well
+                self._fsync_directory()
+
+            if os.path.getsize(self._active) >= self.segment_bytes:
+                self._active = None
+
+    def seal(self):
+        """Close the current segment; later appends start a new one."""
+        with self._lock:
+            self._active = None
+
+    def segments(self, include_active=False):
+        """Segment paths, oldest first."""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        paths = [os.path.join(self.directory, n) for n in names]
+        if not include_active:
+            paths = [p for p in paths if p != self._active]
+        return paths
+
+    @staticmethod
+    def read_segment(path):
+        """The complete lines of a segment; a torn last line from a crash is dropped."""
+        with open(path, "rb") as f:
+            data = f.read()
+        lines = data.decode("utf-8", errors="replace").split("\n")
+        if lines[-1]:
+            log(f"⚠️ Dropping incomplete last line of spool segment {os.path.basename(path)}")
+        return [line for line in lines[:-1] if line]
+
+    def remove(self, path):
+        os.remove(path)
+        self._fsync_directory()
+
+
+_spool = None
+
+
+def get_spool():
+    """The process-wide spool, created on first use."""
+    global _spool
+    if _spool is None:
+        _spool = Spool()
+    return _spool
@@ -0,0 +1,161 @@
+import os
+import json
+import hashlib
+
+from config import STATE_DIR, log
+
+# Measurement -> tag key -> most distinct values it may take as a tag; values
+# beyond that are written as a field. Any other string is never a tag.
+DEFAULT_TAG_SCHEMA = {
+    'nutrition_data': {'meal': 16, 'food_name': 5000},
+    'meal_summary': {'meal': 16},
+}
+
+# Optional JSON file of the same shape; its measurements override the defaults
+TAG_SCHEMA_FILE = os.getenv("MND_TAG_SCHEMA_FILE")
+# Tag values and series seen so far, so limits and new-series counts span runs
+TAG_STATE_FILE = os.getenv("MND_TAG_STATE_FILE", os.path.join(STATE_DIR, "tag_state.json"))
+
+# Which strings are tags, and so which series points land in. Bumped whenever
+# that changes, so an existing install clears its ingest window once (see
+# main.migrate_series_layout) instead of writing each group into a second series.
+# 2: declared tags only, other strings as _text fields, no date tag
+SERIES_LAYOUT = 2
+
+# Strings written as fields get their own key, so they never clash with a
+# numeric field from the same column (an "Amount" of "serving" next to 60)
+TEXT_FIELD_SUFFIX = "_text"
+
+
+def load_tag_schema(path=TAG_SCHEMA_FILE):
+    """The tag schema, with any overrides from ``path`` applied."""
+    schema = {measurement: dict(keys) for measurement, keys in DEFAULT_TAG_SCHEMA.items()}
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                schema.update(json.load(f))
+        except Exception as e:
+            log(f"⚠️ Could not load tag schema from {path}: {e}")
+    return schema
+
+
+def _series_id(measurement, tag_text):
+    return hashlib.sha1(f"{measurement}{tag_text}".encode("utf-8")).hexdigest()[:16]
+
+
+class TagGuard:
+    """Decides which strings may be tags, and counts the series a run creates.
+
+    Only keys declared in the schema become tags. Each declared key keeps
+    the set of values it has had, and those stay tags for good, so their
+    series carry on. A new value that would take the key past its limit
+    is written as a ``<key>_text`` string field instead.
+
+    Every series key written is checked against the ones seen before, so
+    ``report`` can say how many new series a run added.
+
+    ``save`` persists the values and series, along with the current
+    ``SERIES_LAYOUT``; call it once the points are safely written.
+    """
+
+    def __init__(self, schema=None, state_file=TAG_STATE_FILE):
+        self.schema = schema if schema is not None else load_tag_schema()
+        self.state_file = state_file
+        self.values = {}
+        # Keys already warned about this run, so the limit is logged once
+        self._warned = set()
+        self.series = set()
+        # Series layout the stored points were written in; None before any save
+        self.layout = None
+        # Series first seen in this run: id -> measurement
+        self.added = {}
+        self._load()
+
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.values = {key: set(values) for key, values in state.get("values", {}).items()}
+            self.series = set(state.get("series", []))
+            self.layout = state.get("layout")
+        except Exception as e:
+            log(f"⚠️ Could not read tag state {self.state_file}, starting fresh: {e}")
+
+    def save(self):
+        if not self.state_file:
+            return
+        state = {
+            "values": {key: sorted(values) for key, values in self.values.items()},
+            "series": sorted(self.series),
+            "layout": SERIES_LAYOUT,
+        }
+        tmp_path = f"{self.state_file}.tmp"
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_file)
+        self.layout = SERIES_LAYOUT
+
+    def layout_changed(self):
+        """True if the points already written may be in an older series layout."""
+        return self.layout != SERIES_LAYOUT
+
+    def is_tag(self, measurement, key, value):
+        """True if ``value`` may be written as tag ``key`` of ``measurement``."""
+        limit = self.schema.get(measurement, {}).get(key)
+        if limit is None:
+            return False
+        state_key = f"{measurement}|{key}"
+        known = self.values.setdefault(state_key, set())
+        if value in known:
+            return True
+        if len(known) >= limit:
+            if state_key not in self._warned:
+                self._warned.add(state_key)
+                log(f"⚠️ Tag '{key}' on {measurement} reached {limit} distinct values; "
+                    f"writing new ones as field '{key}{TEXT_FIELD_SUFFIX}'")
+            return False
+        known.add(value)
+        return True
+
+    def split(self, measurement, tags):
+        """``(tags, text_fields)``: the tags allowed as such, the rest as string fields."""
+        kept, text_fields = {}, {}
+        for key, value in tags.items():
+            if value is None or str(value) == '':
+                continue
+            if self.is_tag(measurement, key, str(value)):
+                kept[key] = value
+            else:
+                text_fields[f"{key}{TEXT_FIELD_SUFFIX}"] = str(value)
+        return kept, text_fields
+
+    def observe_series(self, measurement, tag_text):
+        """Record one written series key (the line's escaped ``,k=v`` tag text)."""
+        series_id = _series_id(measurement, tag_text)
+        if series_id not in self.series:
+            self.series.add(series_id)
+            self.added[series_id] = measurement
+
+    def merge(self, other):
+        """Fold in what another guard (say, a pool worker's) saw this run."""
+        for key, values in other.values.items():
+            self.values.setdefault(key, set()).update(values)
+        # Two workers may both have added the same series; count it once
+        for series_id, measurement in other.added.items():
+            if series_id not in self.series:
+                self.series.add(series_id)
+                self.added[series_id] = measurement
+
+    def report(self):
+        """Log the series this run added, per measurement."""
+        if not self.added:
+            log("🏷️ No new series")
+            return
+        per_measurement = {}
+        for measurement in self.added.values():
+            per_measurement[measurement] = per_measurement.get(measurement, 0) + 1
+        details = ", ".join(f"{m}: {n}" for m, n in sorted(per_measurement.items()))
+        log(f"🏷️ {len(self.added)} new series ({details}); {len(self.series)} known in total")
@@ -0,0 +1,91 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from config import log
+
+# Upper bounds for each condition; a healthy run returns as soon as the condition holds
+LOGIN_TIMEOUT = float(os.getenv("MND_LOGIN_TIMEOUT", "15"))
+DOWNLOAD_START_TIMEOUT = float(os.getenv("MND_DOWNLOAD_START_TIMEOUT", "10"))
+DOWNLOAD_TIMEOUT = float(os.getenv("MND_DOWNLOAD_TIMEOUT", "30"))
+POLL_FREQUENCY = float(os.getenv("MND_WAIT_POLL_FREQUENCY", "0.1"))
+
+
+# --- Conditions, usable directly as WebDriverWait predicates ---
+def url_leaves(*fragments):
+    """The current URL no longer contains any of ``fragments``."""
+    def condition(driver):
+        url = driver.current_url.lower()
+        return not any(fragment.lower() in url for fragment in fragments)
+    return condition
+
+
+def url_contains_any(*fragments):
+    """The current URL contains one of ``fragments``."""
+    def condition(driver):
+        url = driver.current_url.lower()
+        return any(fragment.lower() in url for fragment in fragments)
+    return condition
+
+
+def cookie_present(domain_fragment):
+    """The browser holds at least one cookie for a matching domain."""
+    def condition(driver):
+        return any(domain_fragment in c.get("domain", "") for c in driver.get_cookies())
+    return condition
+
+
+def download_started(directory):
+    """Chrome has created a file (partial or complete) in ``directory``."""
+    def condition(driver):
+        return any(Path(directory).iterdir())
+    return condition
+
+
+def any_of(*conditions):
+    def condition(driver):
+        return any(c(driver) for c in conditions)
+    return condition
+
+
+def wait_for(driver, condition, timeout, description):
+    """Wait until ``condition`` holds; False (not an exception) on timeout."""
+    with step_timer.step(f"wait: {description}"):
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY).until(condition)
+            return True
+        except TimeoutException:
+            log(f"⚠️ Timed out after {timeout:.0f}s waiting for {description}")
+            return False
+
+
+class StepTimer:
+    """Records how long each step of a job takes."""
+
+    def __init__(self):
+        self.timings = {}
+
+    def reset(self):
+        self.timings = {}
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def report(self):
+        if not self.timings:
+            return
+        log("⏱️ Step timings:")
+        for name, elapsed in self.timings.items():
+            log(f"   - {name}: {elapsed:.2f}s")
+
+
+step_timer = StepTimer()